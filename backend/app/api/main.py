@@ -2,11 +2,15 @@
 MeReader FastAPI Application Main
 """
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.db.sqlite import get_db, initialise_db
+from fastapi.middleware.gzip import GZipMiddleware
+from app.api.responses import ORJSONResponse
+from app.db.sqlite import close_db_connection, get_db, initialise_db
 from app.api.routes import books, progress, query, content
 from app.core.config import settings
+from app.services.ollama_service import ollama_service
 
 logging.basicConfig(
     level=getattr(logging, settings.LOG_LEVEL),
@@ -16,10 +20,20 @@ logger = logging.getLogger(__name__)
 
 initialise_db()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # pooled ollama connections are closed on shutdown
+    await ollama_service.aclose()
+    # runs PRAGMA optimize before the sqlite pools are disposed
+    close_db_connection()
+
 app = FastAPI(
     title="MeReader API",
     description="MeReader API",
     version="0.1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -28,8 +42,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Chapter-Id",
+        "X-Chapter-Title",
+        "X-Chapter-Order",
+        "X-Chapter-Start-Location",
+        "X-Chapter-End-Location",
+    ],
 )
 
+# chapter html and book content compress well, small json bodies are not worth it
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 app.include_router(books.router, prefix="/api/books", tags=["Books"])
 app.include_router(content.router, prefix="/api/content", tags=["Content"])
 app.include_router(progress.router, prefix="/api/progress", tags=["Reading Progress"])
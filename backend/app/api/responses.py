@@ -0,0 +1,91 @@
+"""
+MeReader shared response helpers for serving json and files from disk
+"""
+import hashlib
+import os
+from typing import Any, Dict, Optional
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, JSONResponse
+from app.core.config import settings
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the stdlib encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# book files are never rewritten in place, so clients may keep them indefinitely
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def file_etag(path: str) -> str:
+    """
+    Strong entity tag for a file on disk
+    Args:
+        path: Path to the file
+    Returns:
+        Quoted ETag derived from the path and modification time
+    """
+    digest = hashlib.blake2b(f"{path}{os.path.getmtime(path)}".encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Validator and caching headers for an immutable resource"""
+    return {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    Build a 304 response when the client already holds the current version
+    Args:
+        request: Incoming request
+        etag: Current ETag of the resource
+    Returns:
+        304 response if If-None-Match matches the ETag, otherwise None
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match: return None
+
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
+
+def file_response(
+        path: str,
+        media_type: str,
+        filename: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        request: Optional[Request] = None
+) -> Response:
+    """
+    Serve a file from disk
+    When USE_XACCEL is enabled the body is left to the reverse proxy via X-Accel-Redirect,
+    which expects an internal location such as:
+        location /_protected/ { internal; alias /path/to/backend/data/; }
+    Args:
+        path: Path to the file on disk
+        media_type: Content type of the file
+        filename: Filename for the content disposition header
+        headers: Extra response headers
+        request: Incoming request, when given the file is served as immutable with an ETag and
+            conditional requests are answered with 304
+    Returns:
+        Response serving the file
+    """
+    if request is not None:
+        etag = file_etag(path)
+        cached = not_modified(request, etag)
+        if cached is not None: return cached
+        headers = {**(headers or {}), **cache_headers(etag)}
+
+    if settings.USE_XACCEL:
+        relative_path = os.path.relpath(path, settings.XACCEL_ROOT).replace(os.sep, "/")
+        return Response(
+            media_type=media_type,
+            headers={
+                **(headers or {}),
+                "X-Accel-Redirect": f"{settings.XACCEL_PREFIX.rstrip('/')}/{relative_path}"
+            }
+        )
+
+    return FileResponse(path=path, media_type=media_type, filename=filename, headers=headers)
@@ -1,16 +1,20 @@
 """
 MeReader Book Management API Routes
 """
-import gc
+import asyncio
 import logging
 import os
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
-from app.db.sqlite import get_db, SessionLocal
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, status, BackgroundTasks
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
+from app.api.responses import ORJSONResponse, file_response
+from app.core.cache import library_cache
+from app.db.sqlite import get_db, get_ro_db
 from app.db.models import Book, Chapter, ReadingProgress
 from app.services.embedding_service import embedding_service
 from app.services.book_service import book_service
+from app.services.content_service import release_content_pack
 from app.core.exceptions import BookParsingException, FileStorageException
 from app.models.book import BookListResponse, BookListItem
 
@@ -24,47 +28,41 @@ async def embed_book_content_task(book_id: str):
         book_id: ID of the book to process
     """
     try:
-        gc.collect()
-        db_session = SessionLocal()
-        try:
-            book = db_session.query(Book).filter(Book.id == book_id).first()
-            if not book:
-                logger.error(f"Book not found for embedding: {book_id}")
-                return
-
-            await embedding_service.embed_book_content(book_id=book_id, db_session=db_session)
-
-        except Exception as e: logger.error(f"Error during embedding task: {str(e)}", exc_info=True)
-        finally:
-            db_session.close()
-            gc.collect()
+        # the service reads the book and chapter rows on its own read-only session and closes it before embedding,
+        # no connection is held for the length of the ingest
+        await embedding_service.embed_book_content(book_id=book_id)
 
     except Exception as e:
         logger.error(f"Background embedding task failed for book {book_id}: {str(e)}")
 
 @router.get("/")
-async def list_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def list_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_ro_db)):
     """
     List all books in the library
     """
     try:
-        books = db.query(Book).offset(skip).limit(limit).all()
-        book_items  = []
-
-        for book in books:
-            progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book.id).first()
-
-            book_item = BookListItem(
-                id=str(book.id),
-                title=str(book.title),
-                author=str(book.author),
-                cover_path=str(book.cover_path),
-                completion_percentage=progress.completion_percentage if progress else 0.0,
-                last_read_at=progress.last_read_at if progress else None
+        cache_key = ("list_books", skip, limit)
+        cached = library_cache.get(cache_key)
+        if cached is not None: return Response(content=cached, media_type="application/json")
+
+        # only the columns the listing shows as plain row mappings, description and book_metadata can be large
+        rows = db.execute(
+            select(
+                Book.id, Book.title, Book.author, Book.cover_path,
+                func.coalesce(ReadingProgress.completion_percentage, 0.0).label("completion_percentage"),
+                ReadingProgress.last_read_at
             )
-            book_items.append(book_item)
+            .outerjoin(ReadingProgress, ReadingProgress.book_id == Book.id)
+            .offset(skip)
+            .limit(limit)
+        ).mappings().all()
+
+        # fields come straight from the row mappings, construction skips revalidating them
+        book_items = [BookListItem.model_construct(**row) for row in rows]
 
-        return BookListResponse(books=book_items, total=len(book_items))
+        body = BookListResponse.model_construct(books=book_items, total=len(book_items)).model_dump_json().encode()
+        library_cache.set(cache_key, body)
+        return Response(content=body, media_type="application/json")
 
     except Exception as e:
         logger.error(f"Failed to list books: {str(e)}")
@@ -74,20 +72,29 @@ async def list_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_
         )
 
 @router.get("/{book_id}")
-async def get_book(book_id: str, db: Session = Depends(get_db)):
+def get_book(book_id: str, db: Session = Depends(get_ro_db)):
     """
     Get information about a book
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        cache_key = ("get_book", book_id)
+        cached = library_cache.get(cache_key)
+        if cached is not None: return Response(content=cached, media_type="application/json")
+
+        book = (
+            db.query(Book)
+            .options(selectinload(Book.chapters), selectinload(Book.reading_progress))
+            .filter(Book.id == book_id)
+            .first()
+        )
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        chapters = db.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).all()
-        progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book_id).first()
+        chapters = book.chapters
+        progress = book.reading_progress
 
         response = {
             "id": book.id,
@@ -118,7 +125,10 @@ async def get_book(book_id: str, db: Session = Depends(get_db)):
             "last_read_at": progress.last_read_at if progress else None
         }
 
-        return response
+        # orjson encodes the datetimes itself, no jsonable_encoder pass over the chapters
+        json_response = ORJSONResponse(content=response)
+        library_cache.set(cache_key, json_response.body)
+        return json_response
 
     except HTTPException:
         raise
@@ -130,7 +140,7 @@ async def get_book(book_id: str, db: Session = Depends(get_db)):
         )
 
 @router.post("/upload", status_code=status.HTTP_201_CREATED)
-async def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File(...), db: Session = Depends(get_db)):
+def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File(...), db: Session = Depends(get_db)):
     """
     Upload and process a new book
     """
@@ -145,21 +155,9 @@ async def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File
 
         logger.info(f"Uploading book: {file.filename}")
 
-        # reading content in chunks to save memory
-        chunk_size = 1024 * 1024  # 1mb chunks
-        chunks = []
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk: break
-            chunks.append(chunk)
-
-        file_content = b''.join(chunks)
-        del chunks
-        gc.collect()
-
-        file_path = book_service.save_uploaded_file(file_content, file.filename)
-        del file_content
-        gc.collect()
+        # streaming straight to disk so the whole epub is never held in memory
+        file.file.seek(0)
+        file_path = book_service.save_uploaded_file(file.file, file.filename)
 
         book_data = book_service.parse_book(file_path)
         metadata = book_data['metadata']
@@ -189,16 +187,21 @@ async def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File
         db.add(book)
         db.flush()
 
-        for chapter_data in chapters:
-            chapter = Chapter(
-                book_id=book.id,
-                title=chapter_data.get('title', 'Untitled Chapter'),
-                order=chapter_data.get('order', 0),
-                content_path=chapter_data.get('content_path'),
-                start_location=chapter_data.get('start_location', 0),
-                end_location=chapter_data.get('end_location', 0)
-            )
-            db.add(chapter)
+        # single multi-row insert instead of one INSERT per chapter
+        chapter_rows = [
+            {
+                "book_id": book.id,
+                "title": chapter_data.get('title', 'Untitled Chapter'),
+                "order": chapter_data.get('order', 0),
+                "content_path": chapter_data.get('content_path'),
+                "content_offset": chapter_data.get('content_offset'),
+                "content_size": chapter_data.get('content_size'),
+                "start_location": chapter_data.get('start_location', 0),
+                "end_location": chapter_data.get('end_location', 0)
+            }
+            for chapter_data in chapters
+        ]
+        if chapter_rows: db.bulk_insert_mappings(Chapter, chapter_rows)
 
         reading_progress = ReadingProgress(
             book_id=book.id,
@@ -207,18 +210,22 @@ async def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File
         )
 
         db.add(reading_progress)
-        db.commit()
-        db.refresh(book)
-
-        background_tasks.add_task(embed_book_content_task, book_id=book.id)
 
-        return {
+        # read before the commit, nothing touches the session afterwards so the writer connection is released
+        # before the background task needs it
+        response = {
             "id": book.id,
             "title": book.title,
             "author": book.author,
             "cover_path": book.cover_path,
             "message": "Book uploaded successfully. AI indexing started in the background."
         }
+        db.commit()
+        library_cache.clear()
+
+        background_tasks.add_task(embed_book_content_task, book_id=response["id"])
+
+        return response
 
     except BookParsingException as e:
         logger.error(f"Book parsing error: {str(e)}")
@@ -239,35 +246,52 @@ async def upload_book(background_tasks: BackgroundTasks, file: UploadFile = File
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
+def _delete_book_records(db: Session, book_id: str) -> bool:
+    """
+    Delete a book's files and its row, blocking work run off the event loop
+    Args:
+        db: Database session
+        book_id: ID of the book
+    Returns:
+        False if the book does not exist
+    """
+    book = db.query(Book).filter(Book.id == book_id).first()
+    if not book: return False
+
+    try:
+        if book.file_path and os.path.exists(book.file_path): os.remove(book.file_path)
+
+        if book.cover_path and os.path.exists(book.cover_path): os.remove(book.cover_path)
+
+        if book.content_path and os.path.exists(book.content_path):
+            import shutil
+            # an open memory map would keep the content pack from being deleted on windows
+            release_content_pack(book.content_path)
+            shutil.rmtree(book.content_path)
+
+    except Exception as e: logger.warning(f"Error deleting book files: {str(e)}")
+
+    db.delete(book)
+    db.commit()
+    library_cache.clear()
+    return True
+
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_book(book_id: str, db: Session = Depends(get_db)):
     """
     Delete a book from the library
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book:
+        if not await asyncio.to_thread(_delete_book_records, db, book_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
-        try:
-            if book.file_path and os.path.exists(book.file_path): os.remove(book.file_path)
-
-            if book.cover_path and os.path.exists(book.cover_path): os.remove(book.cover_path)
 
-            if book.content_path and os.path.exists(book.content_path):
-                import shutil
-                shutil.rmtree(book.content_path)
-
-        except Exception as e: logger.warning(f"Error deleting book files: {str(e)}")
-
-        try: await embedding_service.delete_book_embeddings(book_id)
+        # the book row is gone, so is its vector flag
+        try: await embedding_service.delete_book_embeddings(book_id, reset_flag=False)
         except Exception as e: logger.warning(f"Error deleting book embeddings: {str(e)}")
 
-        db.delete(book)
-        db.commit()
-
         return None
 
     except HTTPException: raise
@@ -279,7 +303,7 @@ async def delete_book(book_id: str, db: Session = Depends(get_db)):
         )
 
 @router.get("/cover/{book_id}")
-async def get_book_cover(book_id: str, db: Session = Depends(get_db)):
+def get_book_cover(book_id: str, request: Request, db: Session = Depends(get_ro_db)):
     """
     Get cover image of a book
     """
@@ -293,7 +317,7 @@ async def get_book_cover(book_id: str, db: Session = Depends(get_db)):
                 detail="Cover image not found for this book"
             )
 
-        return FileResponse(path=book.cover_path, media_type="image/jpeg", filename=os.path.basename(book.cover_path))
+        return file_response(book.cover_path, "image/jpeg", filename=os.path.basename(book.cover_path), request=request)
 
     except HTTPException: raise
     except Exception as e:
@@ -1,69 +1,147 @@
 """
 MeReader Content API Routes for serving processed book content
 """
+import asyncio
+import functools
 import logging
+import mimetypes
 import os
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from fastapi.responses import FileResponse
-from app.db.sqlite import get_db
+from app.api.responses import cache_headers, file_etag, file_response, not_modified
+from app.db.sqlite import get_ro_db
 from app.db.models import Book, Chapter
+from app.services.content_service import read_chapter_bytes, read_chapter_content
 from app.services.location_service import location_service
 from app.models.content import ChapterContentResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=128)
+def _content_dir(book_id: str, content_path: str) -> str:
+    """
+    Resolve the directory holding a book's extracted content, cached per book
+    Args:
+        book_id: ID of the book
+        content_path: Content path stored on the book, a directory or a file inside it
+    Returns:
+        Content directory
+    """
+    return os.path.dirname(content_path) if os.path.isfile(content_path) else content_path
+
+@functools.lru_cache(maxsize=512)
+def _read_chapter_text(content_path: str, mtime: float, content_offset: Optional[int], content_size: Optional[int]) -> str:
+    """
+    Read a chapter's html, cached since book content is not modified after upload
+    Args:
+        content_path: The book's content pack, or the chapter's own file for books stored before the pack
+        mtime: Modification time of the file, so a rewritten file is read again
+        content_offset: Byte offset of the chapter within the pack
+        content_size: Byte length of the chapter within the pack
+    Returns:
+        Chapter html content
+    """
+    return read_chapter_content(content_path, content_offset, content_size)
+
+def _read_chapter_cached(chapter: Chapter) -> str:
+    """Read a chapter's html through the chapter cache"""
+    return _read_chapter_text(
+        chapter.content_path, os.path.getmtime(chapter.content_path), chapter.content_offset, chapter.content_size
+    )
+
+def _read_chapter_file(chapter_id: str, content_path: Optional[str], content_offset: Optional[int],
+                       content_size: Optional[int]) -> str:
+    """
+    Read a chapter's html, returning a placeholder paragraph if it cannot be read
+    Args:
+        chapter_id: ID of the chapter, used for logging
+        content_path: The book's content pack or the chapter's own file
+        content_offset: Byte offset of the chapter within the pack
+        content_size: Byte length of the chapter within the pack
+    Returns:
+        Chapter html content
+    """
+    if not content_path or not os.path.exists(content_path): return "<p>Chapter content not found</p>"
+
+    try:
+        return read_chapter_content(content_path, content_offset, content_size)
+    except Exception as e:
+        logger.warning(f"Error reading chapter {chapter_id}: {str(e)}")
+        return f"<p>Error loading chapter: {str(e)}</p>"
+
+async def _stream_book_content(book_id: str, title: str, chapters: List[Dict[str, Any]],
+                               spans: List[Tuple[Optional[str], Optional[int], Optional[int]]]) -> AsyncIterator[bytes]:
+    """
+    Yield the book header, one ndjson line per chapter, holding at most one chapter in memory, and a closing line:
+    {"done": true} once every chapter was sent, or {"error": ...} when the stream stopped early
+    Args:
+        book_id: ID of the book
+        title: Title of the book
+        chapters: Chapter fields in reading order
+        spans: (content path, offset, size) of each chapter
+    Returns:
+        Async iterator over ndjson lines
+    """
+    yield _ndjson_line({"book_id": book_id, "title": title, "total_chapters": len(chapters)})
+
+    chapters_sent = 0
+    try:
+        for chapter, span in zip(chapters, spans):
+            content = await asyncio.to_thread(_read_chapter_file, chapter["id"], *span)
+            yield _ndjson_line({**chapter, "content": content})
+            chapters_sent += 1
+    except Exception as e:
+        logger.error(f"Failed while streaming book content for {book_id}: {str(e)}")
+        # the 200 status is already sent, the client learns about the cut from the last line
+        yield _ndjson_line({"error": f"Failed while streaming book content: {str(e)}", "chapters_sent": chapters_sent})
+        return
+
+    yield _ndjson_line({"done": True, "chapters_sent": chapters_sent})
+
+def _ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+
 @router.get("/image/{book_id}/{image_name}")
-async def get_book_image(book_id: str, image_name: str, db: Session = Depends(get_db)):
+def get_book_image(book_id: str, image_name: str, request: Request, db: Session = Depends(get_ro_db)):
     """
     Get an image from a book
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Book with ID {book_id} not found")
 
         # Get content directory
-        content_dir = os.path.dirname(book.content_path) if os.path.isfile(book.content_path) else book.content_path
-
-        # Log directory and image being searched for
-        logger.info(f"Looking for image: {image_name} in directory: {content_dir}")
-
-        # List all files in the directory to help with debugging
-        all_files = os.listdir(content_dir)
-        logger.info(f"Files in directory: {all_files}")
-
-        # Try different permutations of the filename
-        possible_image_names = [
-            image_name,
-            image_name.lower(),
-            image_name.upper(),
-            image_name.replace('_', '-'),
-            image_name.replace('-', '_')
-        ]
-
-        image_path = None
-        for name in possible_image_names:
-            test_path = os.path.join(content_dir, name)
-            if os.path.exists(test_path):
-                image_path = test_path
-                logger.info(f"Found image at: {image_path}")
-                break
+        content_dir = _content_dir(book.id, book.content_path)
+
+        # exact name first, other permutations only on a miss
+        image_path = os.path.join(content_dir, image_name)
+        if not os.path.isfile(image_path):
+            image_path = None
+            possible_image_names = (
+                image_name.lower(),
+                image_name.upper(),
+                image_name.replace('_', '-'),
+                image_name.replace('-', '_')
+            )
+            for name in possible_image_names:
+                if name == image_name: continue
+                test_path = os.path.join(content_dir, name)
+                if os.path.isfile(test_path):
+                    image_path = test_path
+                    break
 
         if not image_path:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Image {image_name} not found")
 
-        # Determine content type
-        content_type = "image/jpeg"  # Default
-        if image_name.lower().endswith(".png"):
-            content_type = "image/png"
-        elif image_name.lower().endswith(".gif"):
-            content_type = "image/gif"
-        elif image_name.lower().endswith(".svg"):
-            content_type = "image/svg+xml"
+        content_type = mimetypes.guess_type(image_name)[0] or "image/jpeg"
 
-        return FileResponse(path=image_path, media_type=content_type, filename=image_name)
+        return file_response(image_path, content_type, filename=image_name, request=request)
 
     except HTTPException:
         raise
@@ -72,12 +150,12 @@ async def get_book_image(book_id: str, image_name: str, db: Session = Depends(ge
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to get book image: {str(e)}")
 
 @router.get("/index/{book_id}")
-async def get_book_index(book_id: str, db: Session = Depends(get_db)):
+def get_book_index(book_id: str, db: Session = Depends(get_ro_db)):
     """
     Get the index file for a book
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -97,11 +175,7 @@ async def get_book_index(book_id: str, db: Session = Depends(get_db)):
                 detail="Book index file not found"
             )
 
-        return FileResponse(
-            path=index_path,
-            media_type="text/html",
-            filename="index.html"
-        )
+        return file_response(index_path, "text/html", filename="index.html")
 
     except HTTPException: raise
     except Exception as e:
@@ -112,24 +186,21 @@ async def get_book_index(book_id: str, db: Session = Depends(get_db)):
         )
 
 @router.get("/chapter/{book_id}/{chapter_id}", response_model=ChapterContentResponse)
-async def get_chapter_content(book_id: str, chapter_id: str, db: Session = Depends(get_db)):
+def get_chapter_content(book_id: str, chapter_id: str, request: Request, response: Response, db: Session = Depends(get_ro_db)):
     """
     Get the content of a specific chapter
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        chapter = db.query(Chapter).filter(
-            Chapter.book_id == book_id,
-            Chapter.id == chapter_id
-        ).first()
+        chapter = db.get(Chapter, chapter_id)
 
-        if not chapter:
+        if not chapter or chapter.book_id != book_id:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Chapter with ID {chapter_id} not found for book {book_id}"
@@ -142,8 +213,12 @@ async def get_chapter_content(book_id: str, chapter_id: str, db: Session = Depen
             )
 
         try:
-            with open(chapter.content_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            etag = file_etag(chapter.content_path)
+            cached = not_modified(request, etag)
+            if cached is not None: return cached
+            response.headers.update(cache_headers(etag))
+
+            content = _read_chapter_cached(chapter)
 
             return ChapterContentResponse(
                 book_id=book_id,
@@ -170,36 +245,78 @@ async def get_chapter_content(book_id: str, chapter_id: str, db: Session = Depen
             detail=f"Failed to get chapter content: {str(e)}"
         )
 
+@router.get("/chapter-html/{book_id}/{chapter_id}")
+def get_chapter_html(book_id: str, chapter_id: str, request: Request, db: Session = Depends(get_ro_db)):
+    """
+    Get the raw HTML of a specific chapter, with chapter metadata in X-Chapter-* headers
+    """
+    try:
+        chapter = db.get(Chapter, chapter_id)
+
+        if not chapter or chapter.book_id != book_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Chapter with ID {chapter_id} not found for book {book_id}"
+            )
+
+        if not chapter.content_path or not os.path.exists(chapter.content_path):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chapter content file not found"
+            )
+
+        # title is percent-encoded since headers must be latin-1
+        headers = {
+            "X-Chapter-Id": str(chapter.id),
+            "X-Chapter-Title": quote(str(chapter.title)),
+            "X-Chapter-Order": str(chapter.order),
+            "X-Chapter-Start-Location": str(chapter.start_location),
+            "X-Chapter-End-Location": str(chapter.end_location)
+        }
+
+        # books stored before the content pack keep a file per chapter
+        if chapter.content_offset is None:
+            return file_response(chapter.content_path, "text/html; charset=utf-8", headers=headers, request=request)
+
+        etag = file_etag(chapter.content_path)
+        cached = not_modified(request, etag)
+        if cached is not None: return cached
+        return Response(
+            content=read_chapter_bytes(chapter.content_path, chapter.content_offset, chapter.content_size),
+            media_type="text/html; charset=utf-8",
+            headers={**headers, **cache_headers(etag)}
+        )
+
+    except HTTPException: raise
+    except Exception as e:
+        logger.error(f"Failed to get chapter html: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get chapter html: {str(e)}"
+        )
+
 @router.get("/chapter-by-location/{book_id}/{location}")
-async def get_chapter_by_location(book_id: str, location: int, db: Session = Depends(get_db)):
+def get_chapter_by_location(book_id: str, location: int, db: Session = Depends(get_ro_db)):
     """
     Get the chapter that contains a specific location
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        # chapter containing the location
+        # nearest chapter starting at or before the location, this is the containing one when its range covers it
         chapter = db.query(Chapter).filter(
             Chapter.book_id == book_id,
-            Chapter.start_location <= location,
-            Chapter.end_location >= location
-        ).first()
+            Chapter.start_location <= location
+        ).order_by(Chapter.start_location.desc()).first()
 
         if not chapter:
-            # if not found, get the closest chapter
-            chapter = db.query(Chapter).filter(
-                Chapter.book_id == book_id,
-                Chapter.start_location <= location
-            ).order_by(Chapter.start_location.desc()).first()
-
-            if not chapter:
-                # if still not found, get the first chapter
-                chapter = db.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).first()
+            # location precedes every chapter, get the first chapter
+            chapter = db.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).first()
 
         if not chapter:
             raise HTTPException(
@@ -226,12 +343,13 @@ async def get_chapter_by_location(book_id: str, location: int, db: Session = Dep
         )
 
 @router.get("/book-content/{book_id}")
-async def get_full_book_content(book_id: str, db: Session = Depends(get_db)):
+def get_full_book_content(book_id: str, db: Session = Depends(get_ro_db)):
     """
-    Get all content for a book
+    Get all content for a book, streamed as ndjson: a book header line, one line per chapter,
+    then {"done": true} or, when the stream stopped early, {"error": ...}
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -246,33 +364,23 @@ async def get_full_book_content(book_id: str, db: Session = Depends(get_db)):
 
         chapters = db.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).all()
 
-        # extracting content from chapter htmls
-        content_by_chapter = {}
-        for chapter in chapters:
-            if chapter.content_path and os.path.exists(chapter.content_path):
-                try:
-                    with open(chapter.content_path, 'r', encoding='utf-8') as f: content_by_chapter[chapter.id] = f.read()
-                except Exception as e:
-                    logger.warning(f"Error reading chapter {chapter.id}: {str(e)}")
-                    content_by_chapter[chapter.id] = f"<p>Error loading chapter: {str(e)}</p>"
-            else:
-                content_by_chapter[chapter.id] = "<p>Chapter content not found</p>"
+        # plain values only, the session is closed before the stream is consumed
+        chapter_fields = [
+            {
+                "id": chapter.id,
+                "title": chapter.title,
+                "order": chapter.order,
+                "start_location": chapter.start_location,
+                "end_location": chapter.end_location
+            }
+            for chapter in chapters
+        ]
+        spans = [(chapter.content_path, chapter.content_offset, chapter.content_size) for chapter in chapters]
 
-        return {
-            "book_id": book_id,
-            "title": book.title,
-            "chapters": [
-                {
-                    "id": chapter.id,
-                    "title": chapter.title,
-                    "order": chapter.order,
-                    "start_location": chapter.start_location,
-                    "end_location": chapter.end_location,
-                    "content": content_by_chapter.get(chapter.id, "")
-                }
-                for chapter in chapters
-            ]
-        }
+        return StreamingResponse(
+            _stream_book_content(book_id, book.title, chapter_fields, spans),
+            media_type="application/x-ndjson"
+        )
 
     except HTTPException: raise
     except Exception as e:
@@ -283,12 +391,12 @@ async def get_full_book_content(book_id: str, db: Session = Depends(get_db)):
         )
 
 @router.get("/text-at-location/{book_id}/{location}")
-async def get_text_at_location(book_id: str, location: int, context_size: int = 500, db: Session = Depends(get_db)):
+def get_text_at_location(book_id: str, location: int, context_size: int = 500, db: Session = Depends(get_ro_db)):
     """
     Get text at a specific location with context
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
+        book = db.get(Book, book_id)
         if not book:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -316,7 +424,7 @@ async def get_text_at_location(book_id: str, location: int, context_size: int =
 
         # chapter content
         try:
-            with open(chapter.content_path, 'r', encoding='utf-8') as f: chapter_content = f.read()
+            chapter_content = _read_chapter_cached(chapter)
 
             relative_location = location - chapter.start_location + 1
             text_at_location = location_service.get_text_at_location(
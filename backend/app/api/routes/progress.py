@@ -1,32 +1,112 @@
 """
 MeReader Reading Progress API Routes
 """
+import bisect
 import logging
-from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import and_, exists, func, lambda_stmt, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from app.db.sqlite import get_db
+from app.core.cache import TTLCache, library_cache
+from app.db.sqlite import engine, get_db, get_ro_db
 from app.db.models import Book, ReadingProgress, Chapter
-from app.models.progress import ProgressResponse, ChapterInfo
+from app.models.progress import ProgressResponse, ProgressUpdate, ChapterInfo
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# per book (chapter start locations, chapters) sorted by start, chapters never change once a book is ingested
+_chapter_index_cache = TTLCache(maxsize=512, ttl=600)
+
+def _chapter_at_location(db: Session, book_id: str, location: int) -> Optional[ChapterInfo]:
+    """
+    Find the chapter containing a location with a binary search over the book's cached chapter ranges
+    Args:
+        db: Database session, used only when the book's chapters are not cached yet
+        book_id: ID of the book
+        location: Location to look up
+    Returns:
+        Chapter containing the location, or None
+    """
+    index = _chapter_index_cache.get(book_id)
+    if index is None:
+        rows = (
+            db.query(Chapter.id, Chapter.title, Chapter.order, Chapter.start_location, Chapter.end_location)
+            .filter(Chapter.book_id == book_id, Chapter.start_location.isnot(None), Chapter.end_location.isnot(None))
+            .order_by(Chapter.start_location)
+            .all()
+        )
+        chapters = [
+            ChapterInfo(id=row.id, title=row.title, order=row.order,
+                        start_location=row.start_location, end_location=row.end_location)
+            for row in rows
+        ]
+        index = ([chapter.start_location for chapter in chapters], chapters)
+        _chapter_index_cache.set(book_id, index)
+
+    starts, chapters = index
+    position = bisect.bisect_right(starts, location) - 1
+    if position >= 0 and chapters[position].end_location >= location: return chapters[position]
+    return None
+
+def _remember_chapter(progress_id: str, chapter_id: str) -> None:
+    """
+    Store the chapter found by location on the progress row
+    One short transaction on the writer connection, only taken when the chapter was not stored yet
+    """
+    try:
+        with engine.begin() as connection:
+            connection.execute(
+                update(ReadingProgress)
+                .where(ReadingProgress.id == progress_id, ReadingProgress.current_chapter_id.is_(None))
+                .values(current_chapter_id=chapter_id)
+            )
+    except Exception as e:
+        logger.warning(f"Failed to store current chapter for progress {progress_id}: {str(e)}")
+
 @router.get("/{book_id}", response_model=ProgressResponse)
-async def get_reading_progress(book_id: str, db: Session = Depends(get_db)):
+def get_reading_progress(book_id: str, db: Session = Depends(get_ro_db)):
     """
     Get reading progress for a book
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book:
+        # book, progress and current chapter in one round trip: the stored chapter when set, otherwise the one at the location
+        row = db.execute(
+            select(
+                ReadingProgress.id.label("progress_id"),
+                ReadingProgress.current_location,
+                ReadingProgress.completion_percentage,
+                ReadingProgress.current_chapter_id,
+                ReadingProgress.last_read_at,
+                Chapter.id.label("chapter_id"),
+                Chapter.title.label("chapter_title"),
+                Chapter.order.label("chapter_order"),
+                Chapter.start_location,
+                Chapter.end_location
+            )
+            .select_from(Book)
+            .outerjoin(ReadingProgress, ReadingProgress.book_id == Book.id)
+            .outerjoin(Chapter, and_(
+                Chapter.book_id == Book.id,
+                or_(
+                    Chapter.id == ReadingProgress.current_chapter_id,
+                    and_(
+                        ReadingProgress.current_chapter_id.is_(None),
+                        Chapter.start_location <= ReadingProgress.current_location,
+                        Chapter.end_location >= ReadingProgress.current_location
+                    )
+                )
+            ))
+            .where(Book.id == book_id)
+        ).mappings().first()
+        if not row:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book_id).first()
-        if not progress:
+        if row["progress_id"] is None:
             # default progress if none
             return {
                 "book_id": book_id,
@@ -38,44 +118,28 @@ async def get_reading_progress(book_id: str, db: Session = Depends(get_db)):
 
         # current chapter info if available
         current_chapter = None
-        if progress.current_chapter_id:
-            chapter = db.query(Chapter).filter(Chapter.id == progress.current_chapter_id).first()
-            if chapter:
-                current_chapter = ChapterInfo(
-                    id=chapter.id,
-                    title=chapter.title,
-                    order=chapter.order,
-                    start_location=chapter.start_location,
-                    end_location=chapter.end_location
-                )
-        else:
-            # find chapter based on location
-            chapter = db.query(Chapter).filter(
-                Chapter.book_id == book_id,
-                Chapter.start_location <= progress.current_location,
-                Chapter.end_location >= progress.current_location
-            ).first()
-
-            if chapter:
-                current_chapter = ChapterInfo(
-                    id=str(chapter.id),
-                    title=str(chapter.title),
-                    order=int(chapter.order),
-                    start_location=int(chapter.start_location),
-                    end_location=int(chapter.end_location)
-                )
+        if row["chapter_id"] is not None:
+            current_chapter = ChapterInfo.model_construct(
+                id=row["chapter_id"],
+                title=row["chapter_title"],
+                order=row["chapter_order"],
+                start_location=row["start_location"],
+                end_location=row["end_location"]
+            )
 
-                progress.current_chapter_id = chapter.id
-                db.commit()
+            # remember the chapter found by location, read on the reader and written only when missing
+            if row["current_chapter_id"] is None: _remember_chapter(row["progress_id"], row["chapter_id"])
 
-        return {
-            "book_id": book_id,
-            "current_location": progress.current_location,
-            "completion_percentage": progress.completion_percentage,
-            "current_chapter": current_chapter,
-            "last_read_at": progress.last_read_at
-        }
+        return ProgressResponse.model_construct(
+            book_id=book_id,
+            current_location=row["current_location"],
+            completion_percentage=row["completion_percentage"],
+            current_chapter=current_chapter,
+            last_read_at=row["last_read_at"]
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to get reading progress: {str(e)}")
         raise HTTPException(
@@ -83,172 +147,133 @@ async def get_reading_progress(book_id: str, db: Session = Depends(get_db)):
             detail=f"Failed to get reading progress: {str(e)}"
         )
 
-@router.put("/{book_id}")
-async def update_reading_progress(book_id: str, progress_update: dict, db: Session = Depends(get_db)):
+@router.put("/{book_id}", response_model=ProgressResponse)
+def update_reading_progress(book_id: str, progress_update: ProgressUpdate, db: Session = Depends(get_db)):
     """
     Update reading progress for a book
     """
     try:
-        logger.info(f"Raw progress update data: {progress_update}")
-
-        current_location = progress_update.get("current_location")
-        chapter_id = progress_update.get("chapter_id")
-        completion_percentage = progress_update.get("completion_percentage")
-
-        logger.info(f"Processing data - location: {current_location}, chapter: {chapter_id}, percentage: {completion_percentage}")
-
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book:
-            logger.error(f"Book with ID {book_id} not found")
+        current_location = progress_update.current_location
+        chapter_id = progress_update.chapter_id
+        completion_percentage = progress_update.completion_percentage
+
+        # book size, stored progress and its chapter in one round trip
+        state = (
+            db.query(Book.total_locations, ReadingProgress.id, ReadingProgress.current_location,
+                     ReadingProgress.completion_percentage_bp, Chapter)
+            .select_from(Book)
+            .outerjoin(ReadingProgress, ReadingProgress.book_id == Book.id)
+            .outerjoin(Chapter, Chapter.id == ReadingProgress.current_chapter_id)
+            .filter(Book.id == book_id)
+            .first()
+        )
+        if not state:
+            logger.error("Book with ID %s not found", book_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book_id).first()
-        if not progress:
-            logger.info(f"Creating new reading progress for book {book_id}")
-            progress = ReadingProgress(book_id=book_id, current_location=1, completion_percentage=0.0)
-            db.add(progress)
-            db.flush()
+        total_locations, progress_id, new_location, stored_bp, chapter_obj = state
+        new_percentage = (stored_bp or 0) / 100.0
+        if progress_id is None:
+            logger.info("Creating new reading progress for book %s", book_id)
+            new_location, new_percentage = 1, 0.0
 
-        current_chapter = None
         if chapter_id:
-            chapter = db.query(Chapter).filter(
-                Chapter.id == chapter_id,
-                Chapter.book_id == book_id
-            ).first()
-
-            if chapter:
-                logger.info(f"Found chapter: {chapter.title} (ID: {chapter.id})")
-                progress.current_chapter_id = chapter.id
-
-                if current_location is None:
-                    current_location = chapter.start_location
-                    logger.info(f"Using chapter start location: {current_location}")
-
-                current_chapter = {
-                    "id": chapter.id,
-                    "title": chapter.title,
-                    "order": chapter.order,
-                    "start_location": chapter.start_location,
-                    "end_location": chapter.end_location
-                }
+            chapter = db.get(Chapter, chapter_id)
+
+            if chapter and chapter.book_id == book_id:
+                chapter_obj = chapter
+                if current_location is None: current_location = chapter.start_location
 
         if current_location is not None:
-            try:
-                if not isinstance(current_location, int):
-                    current_location = int(float(current_location))
-
-                current_location = max(1, current_location)
-                if book.total_locations:
-                    current_location = min(current_location, book.total_locations)
-
-                logger.info(f"Setting current_location to: {current_location}")
-                progress.current_location = current_location
-
-                if not progress.current_chapter_id:
-                    chapter = db.query(Chapter).filter(
-                        Chapter.book_id == book_id,
-                        Chapter.start_location <= current_location,
-                        Chapter.end_location >= current_location
-                    ).first()
-
-                    if chapter:
-                        logger.info(f"Found chapter for location {current_location}: {chapter.title}")
-                        progress.current_chapter_id = chapter.id
-                        current_chapter = {
-                            "id": chapter.id,
-                            "title": chapter.title,
-                            "order": chapter.order,
-                            "start_location": chapter.start_location,
-                            "end_location": chapter.end_location
-                        }
-
-                if book.total_locations and book.total_locations > 0:
-                    calculated_percentage = (current_location / book.total_locations) * 100
-                    logger.info(f"Calculated percentage: {calculated_percentage}%")
-                    progress.completion_percentage = calculated_percentage
-
-            except Exception as location_error:
-                logger.error(f"Error processing location: {str(location_error)}", exc_info=True)
+            current_location = max(1, current_location)
+            if total_locations: current_location = min(current_location, total_locations)
+            new_location = current_location
 
-        elif completion_percentage is not None:
-            try:
-                if not isinstance(completion_percentage, float):
-                    completion_percentage = float(completion_percentage)
+            if chapter_obj is None: chapter_obj = _chapter_at_location(db, book_id, current_location)
 
-                normalized_percentage = max(0.0, min(100.0, completion_percentage))
-                logger.info(f"Setting completion_percentage to: {normalized_percentage}%")
-                progress.completion_percentage = normalized_percentage
+            if total_locations and total_locations > 0:
+                new_percentage = (current_location / total_locations) * 100
 
-                if book.total_locations and book.total_locations > 0 and (
-                        progress.current_location is None or progress.current_location <= 1):
-                    calculated_location = int((normalized_percentage / 100.0) * book.total_locations)
-                    calculated_location = max(1, min(book.total_locations, calculated_location))
-                    logger.info(f"Calculated location from percentage: {calculated_location}")
-                    progress.current_location = calculated_location
+        elif completion_percentage is not None:
+            new_percentage = max(0.0, min(100.0, completion_percentage))
 
-            except Exception as percentage_error:
-                logger.error(f"Error processing percentage: {str(percentage_error)}", exc_info=True)
+            # location derived from the percentage only while the reader has not moved past the start
+            if total_locations and total_locations > 0 and (new_location is None or new_location <= 1):
+                calculated_location = int((new_percentage / 100.0) * total_locations)
+                new_location = max(1, min(total_locations, calculated_location))
 
-        progress.last_read_at = datetime.utcnow()
+        current_chapter = None
+        if chapter_obj:
+            current_chapter = ChapterInfo(
+                id=chapter_obj.id,
+                title=chapter_obj.title,
+                order=chapter_obj.order,
+                start_location=chapter_obj.start_location,
+                end_location=chapter_obj.end_location
+            )
+
+        # stored as whole basis points, the response reports the stored value
+        completion_bp = int(round(new_percentage * 100))
+        new_percentage = completion_bp / 100.0
 
-        logger.info(f"Pre-commit values: location={progress.current_location}, percentage={progress.completion_percentage}")
+        # single upsert, also safe against a concurrent first write for the same book
+        values = {
+            "current_location": new_location,
+            "completion_percentage_bp": completion_bp,
+            "current_chapter_id": chapter_obj.id if chapter_obj else None,
+            "last_read_at": func.now()
+        }
+        stmt = sqlite_insert(ReadingProgress).values(book_id=book_id, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReadingProgress.book_id],
+            set_={name: stmt.excluded[name] for name in values}
+        ).returning(ReadingProgress.last_read_at)
 
         try:
+            last_read_at = db.execute(stmt).scalar_one()
             db.commit()
-            logger.info("Successfully committed changes to database")
+            library_cache.clear()
         except Exception as commit_error:
-            logger.error(f"Database commit error: {str(commit_error)}", exc_info=True)
+            logger.error("Database commit error: %s", commit_error, exc_info=True)
             db.rollback()
             raise
 
-        if progress.current_chapter_id and not current_chapter:
-            try:
-                chapter = db.query(Chapter).filter(Chapter.id == progress.current_chapter_id).first()
-                if chapter:
-                    current_chapter = {
-                        "id": chapter.id,
-                        "title": chapter.title,
-                        "order": chapter.order,
-                        "start_location": chapter.start_location,
-                        "end_location": chapter.end_location
-                    }
-            except Exception as chapter_error:
-                logger.error(f"Error getting chapter info: {str(chapter_error)}")
-
-        return {
-            "book_id": book_id,
-            "current_location": progress.current_location,
-            "completion_percentage": progress.completion_percentage,
-            "current_chapter": current_chapter,
-            "last_read_at": progress.last_read_at
-        }
+        return ProgressResponse(
+            book_id=book_id,
+            current_location=new_location,
+            completion_percentage=new_percentage,
+            current_chapter=current_chapter,
+            last_read_at=last_read_at
+        )
 
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to update reading progress: {str(e)}", exc_info=True)
+        logger.error("Failed to update reading progress: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update reading progress: {str(e)}"
         )
 
 @router.post("/{book_id}/reset", response_model=ProgressResponse)
-async def reset_reading_progress(book_id: str, db: Session = Depends(get_db)):
+def reset_reading_progress(book_id: str, db: Session = Depends(get_db)):
     """
     Reset reading progress for a book
     """
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book:
+        book_exists = db.execute(lambda_stmt(lambda: select(exists().where(Book.id == book_id)))).scalar()
+        if not book_exists:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Book with ID {book_id} not found"
             )
 
-        progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book_id).first()
+        progress = db.execute(
+            lambda_stmt(lambda: select(ReadingProgress).where(ReadingProgress.book_id == book_id))
+        ).scalar_one_or_none()
         if not progress:
             progress = ReadingProgress(book_id=book_id)
             db.add(progress)
@@ -257,10 +282,11 @@ async def reset_reading_progress(book_id: str, db: Session = Depends(get_db)):
         progress.current_location = 1
         progress.current_chapter_id = None
         progress.completion_percentage = 0.0
-        progress.last_read_at = datetime.utcnow()
+        progress.last_read_at = func.now()
 
         db.commit()
         db.refresh(progress)
+        library_cache.clear()
 
         return {
             "book_id": book_id,
@@ -3,24 +3,33 @@ MeReader AI Query API Routes
 """
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
-from app.db.sqlite import get_db
+from app.core.cache import TTLCache
+from app.db.sqlite import get_ro_db
 from app.db.models import Book, ReadingProgress
 from app.services.rag_service import rag_service
 from app.core.exceptions import AIQueryException, BookNotFoundException
 from app.services.ollama_service import ollama_service
-from app.models.query import (QueryRequest, QueryResponse)
+from app.models.query import (ContextPassage, QueryRequest, QueryResponse)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# only a healthy status is remembered, a failed check is retried on the next request
+_ollama_status_cache = TTLCache(maxsize=1, ttl=5)
+
 async def validate_ollama_service():
     """
     Check if Ollama service is running
     Raises:
         HTTPException: If Ollama service is not available
     """
+    if _ollama_status_cache.get("running"): return
+
     is_running = await ollama_service.check_status()
+    if is_running: _ollama_status_cache.set("running", True)
 
     if not is_running:
         logger.error("Ollama service is not running")
@@ -33,15 +42,20 @@ async def validate_ollama_service():
 async def ask_question(
         book_id: str,
         query_request: QueryRequest,
-        db: Session = Depends(get_db),
+        db: Session = Depends(get_ro_db),
         _: None = Depends(validate_ollama_service)
 ):
     """Ask any question to the AI"""
     try:
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if not book: raise BookNotFoundException(book_id)
+        # book title and progress in one round trip, the rag service loads anything else it needs itself
+        row = db.execute(lambda_stmt(
+            lambda: select(Book.title, ReadingProgress)
+            .outerjoin(ReadingProgress, ReadingProgress.book_id == Book.id)
+            .where(Book.id == book_id)
+        )).first()
+        if not row: raise BookNotFoundException(book_id)
 
-        progress = db.query(ReadingProgress).filter(ReadingProgress.book_id == book_id).first()
+        book_title, progress = row
         if not progress:
             raise AIQueryException("No reading progress found for this book. Please start reading first.")
 
@@ -53,15 +67,26 @@ async def ask_question(
             db=db
         )
 
-        return {
-            "response": result.get("response", ""),
-            "query": query_request.query,
-            "book_id": book_id,
-            "book_title": result.get("book_title", book.title),
-            "context_used": result.get("context_used", []),
-            "location_boundary": result.get("location_boundary", progress.current_location),
-            "progress_boundary": result.get("progress_boundary", progress.completion_percentage)
-        }
+        # built from values the rag service produced, serialised directly instead of revalidated by the route
+        context_used = [
+            ContextPassage.model_construct(
+                text=snippet["text"],
+                chapter_title=snippet["chapter_title"],
+                location=snippet["location"],
+                relevance_score=snippet["relevance_score"]
+            )
+            for snippet in result.get("context_used", [])
+        ]
+        response = QueryResponse.model_construct(
+            response=result.get("response", ""),
+            query=query_request.query,
+            book_id=book_id,
+            book_title=result.get("book_title", book_title),
+            context_used=context_used,
+            location_boundary=result.get("location_boundary", progress.current_location),
+            progress_boundary=result.get("progress_boundary", progress.completion_percentage)
+        )
+        return Response(content=response.model_dump_json(), media_type="application/json")
 
     except BookNotFoundException as e:
         logger.error(f"Book not found: {str(e)}")
@@ -5,14 +5,19 @@ import logging
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func, update
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
-from app.db.sqlite import get_db
+from app.core.cache import TTLCache
+from app.db.sqlite import get_db, get_ro_db, SessionLocal
 from app.db.models import Settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# the single settings row, read on every page and written rarely
+_settings_cache = TTLCache(maxsize=1, ttl=30)
+
 class SettingsUpdate(BaseModel):
     """Request model for updating settings"""
     theme: Optional[str] = Field(None, description="UI theme (light/dark/sepia)")
@@ -38,20 +43,29 @@ class SettingsResponse(BaseModel):
         from_attributes = True
 
 @router.get("/", response_model=SettingsResponse)
-async def get_settings(db: Session = Depends(get_db)):
+def get_settings(db: Session = Depends(get_ro_db)):
     """
     Get user settings
     """
     try:
-        settings = db.query(Settings).first()
-
-        if not settings:
-            settings = Settings()
-            db.add(settings)
-            db.commit()
-            db.refresh(settings)
+        cached = _settings_cache.get("settings")
+        if cached is not None: return cached
 
-        return settings
+        settings = db.query(Settings).first()
+        if settings: response = SettingsResponse.model_validate(settings)
+        else:
+            # the default row is created once, on a writer session of its own
+            with SessionLocal() as write_db:
+                settings = write_db.query(Settings).first()
+                if not settings:
+                    settings = Settings()
+                    write_db.add(settings)
+                    write_db.commit()
+                    write_db.refresh(settings)
+                response = SettingsResponse.model_validate(settings)
+        _settings_cache.set("settings", response)
+
+        return response
 
     except Exception as e:
         logger.error(f"Failed to get settings: {str(e)}")
@@ -61,7 +75,7 @@ async def get_settings(db: Session = Depends(get_db)):
         )
 
 @router.put("/", response_model=SettingsResponse)
-async def update_settings(settings_update: SettingsUpdate, db: Session = Depends(get_db)):
+def update_settings(settings_update: SettingsUpdate, db: Session = Depends(get_db)):
     """
     Update user settings
     """
@@ -78,10 +92,11 @@ async def update_settings(settings_update: SettingsUpdate, db: Session = Depends
                 setattr(settings, field, value)
 
         # updating timestamp
-        settings.updated_at = datetime.utcnow()
+        settings.updated_at = func.now()
 
         db.commit()
         db.refresh(settings)
+        _settings_cache.clear()
 
         return settings
 
@@ -93,32 +108,37 @@ async def update_settings(settings_update: SettingsUpdate, db: Session = Depends
         )
 
 @router.post("/reset", response_model=SettingsResponse)
-async def reset_settings(db: Session = Depends(get_db)):
+def reset_settings(db: Session = Depends(get_db)):
     """
     Reset settings to default values
     """
     try:
-        settings = db.query(Settings).first()
+        # defaults written and read back in a single statement
+        stmt = update(Settings).values(
+            theme="dark",
+            font_family="Default",
+            font_size=16.0,
+            line_spacing=1.5,
+            margin_size=16.0,
+            text_alignment="left",
+            updated_at=func.now()
+        ).returning(Settings)
+        settings = db.execute(stmt).scalars().first()
 
         if not settings:
             settings = Settings()
             db.add(settings)
+            db.commit()
+            db.refresh(settings)
+            response = SettingsResponse.model_validate(settings)
         else:
-            # defaults
-            settings.theme = "dark"
-            settings.font_family = "Default"
-            settings.font_size = 16.0
-            settings.line_spacing = 1.5
-            settings.margin_size = 16.0
-            settings.text_alignment = "left"
-
-        # updating timestamp
-        settings.updated_at = datetime.utcnow()
+            # built before commit so the returned row is not expired and reloaded
+            response = SettingsResponse.model_validate(settings)
+            db.commit()
 
-        db.commit()
-        db.refresh(settings)
+        _settings_cache.clear()
 
-        return settings
+        return response
 
     except Exception as e:
         logger.error(f"Failed to reset settings: {str(e)}")
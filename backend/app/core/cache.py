@@ -0,0 +1,59 @@
+"""
+MeReader In-Memory Caches
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time to live"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Get a cached value
+        Args:
+            key: cache key
+            default: value returned on a miss or an expired entry
+        Returns:
+            Cached value or default
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def evict(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every entry whose key matches the predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]: del self._entries[key]
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock: self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# serialized library listing and book detail responses, cleared whenever a book or its progress changes
+library_cache = TTLCache(maxsize=256, ttl=30)
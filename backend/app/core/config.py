@@ -2,7 +2,9 @@
 MeReader Application Configuration
 """
 import os
-from typing import Dict, Any
+from functools import cached_property
+from pathlib import Path
+from typing import Dict, Any, Optional
 from pydantic import validator
 from pydantic_settings import BaseSettings
 
@@ -20,12 +22,22 @@ class Settings(BaseSettings):
     QDRANT_LOCATION: str = "data/qdrant"
     QDRANT_COLLECTION_NAME: str = "mereader_books"
     QDRANT_VECTOR_SIZE: int = 768
+    # qdrant server, the embedded store at QDRANT_LOCATION is used when no host is set
+    QDRANT_HOST: Optional[str] = None
+    QDRANT_PORT: int = 6333
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_PREFER_GRPC: bool = True
 
     # storage paths
     UPLOAD_DIR: str = "data/uploads"
     CONTENT_DIR: str = "data/contents"
     COVER_DIR: str = "data/covers"
 
+    # reverse proxy (nginx X-Accel-Redirect) file serving
+    USE_XACCEL: bool = False
+    XACCEL_PREFIX: str = "/_protected"
+    XACCEL_ROOT: str = "data"
+
     # Ollama settings
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     # OLLAMA_LLM_MODEL: str = "gemma3:4b"
@@ -54,16 +66,34 @@ class Settings(BaseSettings):
         env_file = ".env"
         env_file_encoding = "utf-8"
 
-    @validator("UPLOAD_DIR", "CONTENT_DIR", "COVER_DIR", "QDRANT_LOCATION")
+    @validator("UPLOAD_DIR", "CONTENT_DIR", "COVER_DIR", "QDRANT_LOCATION", "BM25_INDEX_CACHE_DIR")
     def create_directories(cls, directory_path):
         """Ensure directories exist"""
         os.makedirs(directory_path, exist_ok=True)
         return directory_path
 
+    @cached_property
+    def bm25_cache_path(self) -> Path:
+        """BM25 cache directory, resolved once"""
+        return Path(self.BM25_INDEX_CACHE_DIR)
+
+    def bm25_index_dir(self, book_id: str) -> Path:
+        """Directory holding a book's BM25 index arrays and chunks"""
+        return self.bm25_cache_path / book_id
+
+    def bm25_index_file(self, book_id: str) -> Path:
+        """Path of a book's pickled BM25 index, the format used before bm25_index_dir"""
+        return self.bm25_cache_path / f"{book_id}_bm25.pkl"
+
+    def bm25_metadata_file(self, book_id: str) -> Path:
+        """Path of a book's BM25 chunk metadata, kept alongside the pickled index"""
+        return self.bm25_cache_path / f"{book_id}_metadata.json"
+
     def get_qdrant_config(self) -> Dict[str, Any]:
         """Return Qdrant configuration dictionary"""
         return {
             "location": self.QDRANT_LOCATION,
+            "host": self.QDRANT_HOST,
             "collection_name": self.QDRANT_COLLECTION_NAME,
             "vector_size": self.QDRANT_VECTOR_SIZE,
         }
@@ -77,10 +107,3 @@ class Settings(BaseSettings):
         }
 
 settings = Settings()
-
-#  all dirs exist
-os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-os.makedirs(settings.CONTENT_DIR, exist_ok=True)
-os.makedirs(settings.COVER_DIR, exist_ok=True)
-os.makedirs(settings.QDRANT_LOCATION, exist_ok=True)
-os.makedirs(settings.BM25_INDEX_CACHE_DIR, exist_ok=True)
\ No newline at end of file
@@ -45,11 +45,13 @@ class VectorStoreException(MeReaderException):
 class OllamaServiceException(MeReaderException):
     """Exception raised when Ollama service fails"""
 
-    def __init__(self, detail: str = "Ollama service operation failed"):
+    def __init__(self, detail: str = "Ollama service operation failed", ollama_status_code: int | None = None):
         super().__init__(
             detail=detail,
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE
         )
+        # status code of the ollama api response, when the failure came from one
+        self.ollama_status_code = ollama_status_code
 
 class DatabaseException(MeReaderException):
     """Exception raised when database operations fail"""
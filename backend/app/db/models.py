@@ -1,19 +1,36 @@
 """
 MeReader SQLAlchemy Database Models
 """
-import uuid
-from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
+import os
+import time
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, Index, func
 #from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
+def generate_id() -> str:
+    """
+    Generate a time-ordered UUIDv7 primary key
+    New rows sort after existing ones, so inserts append to the end of the primary key index
+    instead of landing on random pages
+    Returns:
+        UUID string with a 48-bit millisecond timestamp prefix and random tail
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # rfc 4122 variant
+    # formatted directly, same text as str(uuid.UUID(int=value)) without building the object
+    digits = f"{value:032x}"
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
 class Book(Base):
     """Book model representing a book in the library"""
     __tablename__ = "books"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=generate_id)
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
@@ -28,49 +45,71 @@ class Book(Base):
     total_locations = Column(Integer, nullable=True)
     total_chapters = Column(Integer, nullable=True)
     book_metadata = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    has_vectors = Column(Boolean, nullable=True, default=False)  # mirrors qdrant, null until known for older rows
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     reading_progress = relationship("ReadingProgress", back_populates="book", uselist=False, cascade="all, delete-orphan")
-    chapters = relationship("Chapter", back_populates="book", cascade="all, delete-orphan")
+    chapters = relationship("Chapter", back_populates="book", cascade="all, delete-orphan", order_by="Chapter.order")
 
 class Chapter(Base):
     """Chapter model representing a chapter in a book"""
     __tablename__ = "chapters"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=generate_id)
     book_id = Column(String, ForeignKey("books.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=False)
     order = Column(Integer, nullable=False)
     content_path = Column(String, nullable=True)
+    content_offset = Column(Integer, nullable=True)  # byte range within the book's content pack
+    content_size = Column(Integer, nullable=True)
     start_location = Column(Integer, nullable=True)
     end_location = Column(Integer, nullable=True)
 
     book = relationship("Book", back_populates="chapters")
 
+    __table_args__ = (
+        Index("ix_chapter_book_order", "book_id", "order"),
+        # covers the location range lookups, containment checks are answered from the index alone
+        Index("ix_chapter_book_range", "book_id", "start_location", "end_location"),
+    )
+
 class ReadingProgress(Base):
     """Reading progress model tracking user reading position"""
     __tablename__ = "reading_progress"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=generate_id)
     book_id = Column(String, ForeignKey("books.id", ondelete="CASCADE"), unique=True, nullable=False)
     current_location = Column(Integer, default=0)
     current_chapter_id = Column(String, ForeignKey("chapters.id", ondelete="SET NULL"), nullable=True)
-    completion_percentage = Column(Float, default=0.0)
-    last_read_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    completion_percentage_bp = Column(Integer, default=0)  # basis points, 0-10000
+    last_read_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     book = relationship("Book", back_populates="reading_progress")
     current_chapter = relationship("Chapter")
 
+    @hybrid_property
+    def completion_percentage(self) -> float:
+        """Completion percentage, stored as whole basis points"""
+        return (self.completion_percentage_bp or 0) / 100.0
+
+    @completion_percentage.setter
+    def completion_percentage(self, value: float) -> None:
+        self.completion_percentage_bp = int(round(value * 100))
+
+    @completion_percentage.expression
+    def completion_percentage(cls):
+        return cls.completion_percentage_bp / 100.0
+
 class Settings(Base):
     """User settings model"""
     __tablename__ = "settings"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=generate_id)
     theme = Column(String, default="dark")
     font_family = Column(String, default="Default")
     font_size = Column(Float, default=16.0)
     line_spacing = Column(Float, default=1.5)
     margin_size = Column(Float, default=16.0)
     text_alignment = Column(String, default="left")
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
\ No newline at end of file
@@ -1,22 +1,85 @@
 """
 MeReader Qdrant Vector Store Integration
 """
+import asyncio
+import contextlib
+import functools
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
-from qdrant_client import QdrantClient
+import threading
+import warnings
+from array import array
+from itertools import chain, islice, repeat
+from typing import Iterable, List, Dict, Any, Optional, Sequence, Set
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http.models import Distance, VectorParams, PointStruct
-from qdrant_client.models import Filter, FieldCondition, MatchValue, Range
+from qdrant_client.models import (
+    Filter, FieldCondition, IntegerIndexParams, IntegerIndexType, MatchValue, PayloadSchemaType,
+    QuantizationSearchParams, QueryRequest, Range, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    SearchParams
+)
+from sqlalchemy import select
+from app.core.cache import TTLCache
 from app.core.config import settings
 from app.core.exceptions import VectorStoreException
+from app.db.models import Book
+from app.db.sqlite import read_engine
 
 logger = logging.getLogger(__name__)
 
+# points per upsert request, large enough to amortise the request, small enough to stay clear of timeouts
+UPSERT_BATCH_SIZE = 500
+
+# payload fields indexed for filtering
+PAYLOAD_INDEXES = {
+    "book_id": PayloadSchemaType.KEYWORD,
+    # only ever filtered by range, against the reading position
+    "location": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=False, range=True),
+}
+
+# payload fields search results carry by default, the ones the rag context and snippets read
+SEARCH_PAYLOAD_FIELDS = ("text", "location", "chapter_title", "chapter_id", "content_type")
+
+# int8 copies of the vectors kept in ram, a quarter of the bandwidth per distance evaluation
+QUANTIZATION_CONFIG = ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True))
+
+# candidates found on the int8 vectors, oversampled and rescored against the originals to keep recall
+SEARCH_PARAMS = SearchParams(
+    hnsw_ef=64,
+    quantization=QuantizationSearchParams(ignore=False, rescore=True, oversampling=2.0)
+)
+
+@functools.lru_cache(maxsize=1024)
+def _book_filter(book_id: str) -> Filter:
+    """Filter limiting points to a book, built once per book and shared, callers must not modify it"""
+    return Filter(must=[FieldCondition(key="book_id", match=MatchValue(value=book_id))])
+
 class QdrantManager:
     """Manager for Qdrant vector database ops"""
     def __init__(self):
+        # search results keyed by book and query, dropped for a book whenever its vectors change
+        self.search_cache = TTLCache(maxsize=2000, ttl=600)
+
         try:
-            logger.info(f"Starting Qdrant with location: {settings.QDRANT_LOCATION}")
-            self.client = QdrantClient(path=settings.QDRANT_LOCATION)
+            if settings.QDRANT_HOST:
+                # a qdrant server searches segments in parallel, the async client lets searches skip the thread pool
+                logger.info(f"Connecting to Qdrant server at {settings.QDRANT_HOST}")
+                server = {
+                    "host": settings.QDRANT_HOST,
+                    "port": settings.QDRANT_PORT,
+                    "grpc_port": settings.QDRANT_GRPC_PORT,
+                    "prefer_grpc": settings.QDRANT_PREFER_GRPC
+                }
+                self.client = QdrantClient(**server)
+                self.async_client: Optional[AsyncQdrantClient] = AsyncQdrantClient(**server)
+            else:
+                # embedded mode locks its storage folder, there is no second client to open on it
+                logger.info(f"Starting Qdrant with location: {settings.QDRANT_LOCATION}")
+                self.client = QdrantClient(path=settings.QDRANT_LOCATION)
+                self.async_client = None
+
+            # the embedded client does not lock its collections, concurrent upserts from worker threads are serialised
+            self._upsert_lock = contextlib.nullcontext() if settings.QDRANT_HOST else threading.Lock()
 
             collections = self.client.get_collections().collections
             collection_names = [collection.name for collection in collections]
@@ -28,67 +91,140 @@ class QdrantManager:
                     vectors_config=VectorParams(
                         size=settings.QDRANT_VECTOR_SIZE,
                         distance=Distance.COSINE
-                    )
+                    ),
+                    quantization_config=QUANTIZATION_CONFIG
                 )
                 logger.info(f"Created collection: {settings.QDRANT_COLLECTION_NAME}")
+            elif settings.QDRANT_HOST: self._ensure_quantization()
+
+            self._create_payload_indexes()
         except Exception as e:
             raise VectorStoreException(f"Failed to start Qdrant: {str(e)}")
 
-    def has_vectors_for_book(self, book_id: str) -> bool:
+    def _ensure_quantization(self) -> None:
+        """
+        Add int8 scalar quantization to a collection created without it, a Qdrant server builds the
+        quantized vectors in the background and existing points keep their originals for rescoring
+        The embedded client keeps no quantized copies, so this is only asked of a server
+        """
+        try:
+            collection = self.client.get_collection(settings.QDRANT_COLLECTION_NAME)
+            if collection.config.quantization_config is not None: return
+
+            self.client.update_collection(
+                collection_name=settings.QDRANT_COLLECTION_NAME,
+                quantization_config=QUANTIZATION_CONFIG
+            )
+            logger.info(f"Enabled scalar quantization on collection: {settings.QDRANT_COLLECTION_NAME}")
+        except Exception as e:
+            logger.warning(f"Failed to enable scalar quantization: {str(e)}")
+
+    def _create_payload_indexes(self) -> None:
+        """
+        Index the payload fields every search filters on, creating an existing index again is a no-op
+        The embedded client accepts these without effect, a Qdrant server uses them
+        """
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            try:
+                with warnings.catch_warnings():
+                    warnings.filterwarnings("ignore", message="Payload indexes have no effect")
+                    self.client.create_payload_index(
+                        collection_name=settings.QDRANT_COLLECTION_NAME,
+                        field_name=field_name,
+                        field_schema=field_schema
+                    )
+            except Exception as e:
+                logger.warning(f"Failed to create payload index on {field_name}: {str(e)}")
+
+    def has_vectors_for_book(self, book_id: str, verify: bool = False) -> bool:
         """
         Check if vectors exist for a book
         Args:
             book_id: Book ID to check
+            verify: Ask qdrant for the book's points instead of reading the flag on the book row
         Returns:
             True if vectors exist, else False
         """
         try:
-            search_filter = Filter(
-                must=[FieldCondition(key="book_id", match=MatchValue(value=book_id))])
-            result = self.client.scroll(
+            if not verify:
+                # set once a book is fully embedded, one indexed primary key read
+                with read_engine.connect() as connection:
+                    return bool(connection.scalar(select(Book.has_vectors).where(Book.id == book_id)))
+
+            # approximate count answers from the payload index without reading any point
+            result = self.client.count(
                 collection_name=settings.QDRANT_COLLECTION_NAME,
-                scroll_filter=search_filter,
-                limit=1
+                count_filter=_book_filter(book_id),
+                exact=False
             )
-            return bool(result[0])
+            return result.count > 0
         except Exception as e:
             logger.error(f"Failed to check existing vectors for book {book_id}: {str(e)}")
             return False
 
+    def get_book_point_ids(self, book_id: str) -> Set[str]:
+        """
+        IDs of the points already stored for a book, paged through without payloads or vectors
+        Args:
+            book_id: ID of the book
+        Returns:
+            Set of point IDs, empty when the book has none or the lookup fails
+        """
+        point_ids = set()
+        try:
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=settings.QDRANT_COLLECTION_NAME,
+                    scroll_filter=_book_filter(book_id),
+                    limit=UPSERT_BATCH_SIZE,
+                    offset=offset,
+                    with_payload=False,
+                    with_vectors=False
+                )
+                point_ids.update(str(point.id) for point in points)
+                if offset is None: return point_ids
+
+        except Exception as e:
+            logger.warning(f"Failed to list stored points for book {book_id}: {str(e)}")
+            return point_ids
+
     def add_text_vectors(
             self,
-            vectors: List[List[float]],
-            metadata: List[Dict[str, Any]],
-            ids: Optional[List[str]] = None
+            vectors: Iterable[List[float]],
+            metadata: Iterable[Dict[str, Any]],
+            ids: Optional[Iterable[str]] = None
     ) -> List[str]:
         """
-        Add text vectors to Qdrant
+        Add text vectors to Qdrant, upserted in batches of UPSERT_BATCH_SIZE points
         Args:
-            vectors: List of vector embeddings
-            metadata: List of metadata dictionaries for each vector
-            ids: list of IDs for the vectors
+            vectors: Vector embeddings, any iterable
+            metadata: Metadata dictionary for each vector
+            ids: IDs for the vectors
         Returns:
             List of IDs for the added vectors
         """
         try:
             # if no ids, Qdrant will generate them
-            points = []
-            for i, (vector, meta) in enumerate(zip(vectors, metadata)):
-                point_id = ids[i] if ids and i < len(ids) else None
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=vector,
-                        payload=meta
-                    )
-                )
-
-            result = self.client.upsert(
-                collection_name=settings.QDRANT_COLLECTION_NAME,
-                points=points
+            point_ids = chain(ids, repeat(None)) if ids is not None else repeat(None)
+            points = (
+                PointStruct(id=point_id, vector=vector, payload=meta)
+                for vector, meta, point_id in zip(vectors, metadata, point_ids)
             )
 
-            return [str(point.id) for point in points]
+            added_ids = []
+            book_ids = set()
+            while batch := list(islice(points, UPSERT_BATCH_SIZE)):
+                with self._upsert_lock:
+                    self.client.upsert(
+                        collection_name=settings.QDRANT_COLLECTION_NAME,
+                        points=batch
+                    )
+                added_ids.extend(str(point.id) for point in batch)
+                book_ids.update(point.payload.get("book_id") for point in batch)
+
+            for book_id in book_ids: self._invalidate_search_cache(book_id)
+            return added_ids
 
         except Exception as e:
             logger.error(f"Failed to add vectors to Qdrant: {str(e)}")
@@ -102,51 +238,157 @@ class QdrantManager:
             score_threshold: float = 0.6,
             location_boundary: Optional[int] = None,
             filter_metadata: Optional[Dict[str, Any]] = None,
+            payload_fields: Sequence[str] = SEARCH_PAYLOAD_FIELDS,
     ) -> List[Dict[str, Any]]:
         """
-        Search for similar vectors with metadata filtering
+        Search for similar vectors with metadata filtering, repeated searches are answered from the cache
+        Only payload_fields are returned with each result, callers needing more of the payload pass them
+        """
+        return self.search_vectors_batch([{
+            "query_vector": query_vector,
+            "book_id": book_id,
+            "limit": limit,
+            "score_threshold": score_threshold,
+            "location_boundary": location_boundary,
+            "filter_metadata": filter_metadata,
+            "payload_fields": payload_fields
+        }])[0]
+
+    def search_vectors_batch(self, searches: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        Run several vector searches in a single Qdrant request
+        Args:
+            searches: Keyword arguments of search_vectors for each search
+        Returns:
+            Results of each search, in the same order
         """
         try:
-            # base filter
-            filter_conditions = [FieldCondition(key="book_id", match=MatchValue(value=book_id))]
-
-            if location_boundary is not None:
-                filter_conditions.append(
-                    FieldCondition(
-                        key="location",
-                        range=Range(lte=location_boundary)
+            cache_keys, batch_results, pending, requests = self._prepare_batch(searches)
+            if pending:
+                # the embedded client searches exhaustively and warns that search params have no effect
+                with warnings.catch_warnings():
+                    warnings.filterwarnings("ignore", message="Local mode performs exact")
+                    responses = self.client.query_batch_points(
+                        collection_name=settings.QDRANT_COLLECTION_NAME,
+                        requests=requests
                     )
-                )
+                self._store_batch(cache_keys, batch_results, pending, responses)
 
-            if filter_metadata:
-                for key, value in filter_metadata.items():
-                    filter_conditions.append(FieldCondition(key=key, match=MatchValue(value=value)))
+            # copies, callers tag the result dicts they get back
+            return [[dict(result) for result in results] for results in batch_results]
 
-            query_filter = Filter(must=filter_conditions)
+        except Exception as e:
+            logger.error(f"failed to search vectors in qdrant: {str(e)}")
+            raise VectorStoreException(f"failed to search vectors in qdrant: {str(e)}")
 
-            search_result = self.client.search(
-                collection_name=settings.QDRANT_COLLECTION_NAME,
-                query_vector=query_vector,
-                query_filter=query_filter,
-                limit=limit,
-                score_threshold=score_threshold
-            )
+    async def search_vectors_batch_async(self, searches: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """
+        search_vectors_batch for async callers, awaited on the async client against a Qdrant server,
+        in a worker thread with the embedded client
+        """
+        if self.async_client is None: return await asyncio.to_thread(self.search_vectors_batch, searches)
 
-            results = []
-            for scored_point in search_result:
-                result = {
-                    "id": str(scored_point.id),
-                    "score": scored_point.score,
-                    **scored_point.payload
-                }
-                results.append(result)
+        try:
+            cache_keys, batch_results, pending, requests = self._prepare_batch(searches)
+            if pending:
+                responses = await self.async_client.query_batch_points(
+                    collection_name=settings.QDRANT_COLLECTION_NAME,
+                    requests=requests
+                )
+                self._store_batch(cache_keys, batch_results, pending, responses)
 
-            return results
+            return [[dict(result) for result in results] for results in batch_results]
 
         except Exception as e:
             logger.error(f"failed to search vectors in qdrant: {str(e)}")
             raise VectorStoreException(f"failed to search vectors in qdrant: {str(e)}")
 
+    def _prepare_batch(self, searches: List[Dict[str, Any]]) -> tuple:
+        """
+        Look a batch of searches up in the cache and build the requests for the rest
+        Returns:
+            Cache keys, results with None for every miss, indices of the misses and their requests
+        """
+        searches = [{"limit": 15, "score_threshold": 0.6, "location_boundary": None,
+                     "filter_metadata": None, "payload_fields": SEARCH_PAYLOAD_FIELDS, **search}
+                    for search in searches]
+        cache_keys = [self._search_cache_key(**search) for search in searches]
+        batch_results: List[Optional[List[Dict[str, Any]]]] = [self.search_cache.get(key) for key in cache_keys]
+
+        # only the searches missing from the cache go to qdrant
+        pending = [i for i, cached in enumerate(batch_results) if cached is None]
+        requests = [
+            QueryRequest(
+                query=searches[i]["query_vector"],
+                filter=self._search_filter(
+                    searches[i]["book_id"], searches[i]["location_boundary"], searches[i]["filter_metadata"]
+                ),
+                limit=searches[i]["limit"],
+                score_threshold=searches[i]["score_threshold"],
+                params=SEARCH_PARAMS,
+                with_payload=list(searches[i]["payload_fields"]),
+                with_vector=False
+            )
+            for i in pending
+        ]
+        return cache_keys, batch_results, pending, requests
+
+    def _store_batch(self, cache_keys: List[tuple], batch_results: List, pending: List[int], responses: List) -> None:
+        """Fill the misses of a batch from Qdrant's responses and cache them"""
+        for i, response in zip(pending, responses):
+            # dict union merges the payload in one c-level copy
+            results = [
+                {"id": str(scored_point.id), "score": scored_point.score} | scored_point.payload
+                for scored_point in response.points
+            ]
+
+            self.search_cache.set(cache_keys[i], results)
+            batch_results[i] = results
+
+    @staticmethod
+    def _search_filter(
+            book_id: str,
+            location_boundary: Optional[int],
+            filter_metadata: Optional[Dict[str, Any]]
+    ) -> Filter:
+        """Payload filter limiting a search to a book, up to the location boundary"""
+        book_filter = _book_filter(book_id)
+        if location_boundary is None and not filter_metadata: return book_filter
+
+        # extended on a copy of the shared book condition
+        filter_conditions = list(book_filter.must)
+
+        if location_boundary is not None:
+            filter_conditions.append(
+                FieldCondition(
+                    key="location",
+                    range=Range(lte=location_boundary)
+                )
+            )
+
+        if filter_metadata:
+            for key, value in filter_metadata.items():
+                filter_conditions.append(FieldCondition(key=key, match=MatchValue(value=value)))
+
+        return Filter(must=filter_conditions)
+
+    @staticmethod
+    def _search_cache_key(
+            query_vector: List[float],
+            book_id: str,
+            limit: int,
+            score_threshold: float,
+            location_boundary: Optional[int],
+            filter_metadata: Optional[Dict[str, Any]],
+            payload_fields: Sequence[str]
+    ) -> tuple:
+        """Search cache key, book id first so a book's entries can be dropped together"""
+        vector_digest = hashlib.blake2b(array("f", query_vector).tobytes(), digest_size=16).digest()
+        return (
+            book_id, vector_digest, limit, score_threshold, location_boundary,
+            tuple(sorted(filter_metadata.items())) if filter_metadata else None, tuple(payload_fields)
+        )
+
     def delete_book_vectors(self, book_id: str) -> bool:
         """
         Delete vectors embeddings of a book
@@ -156,15 +398,11 @@ class QdrantManager:
             True if deletion was successful
         """
         try:
-            filter_condition = Filter(
-                must=[FieldCondition(key="book_id", match=MatchValue(value=book_id))
-                ]
-            )
-
             self.client.delete(
                 collection_name=settings.QDRANT_COLLECTION_NAME,
-                points_selector=filter_condition
+                points_selector=_book_filter(book_id)
             )
+            self._invalidate_search_cache(book_id)
 
             logger.info(f"Deleted vectors for book {book_id}")
             return True
@@ -173,4 +411,8 @@ class QdrantManager:
             logger.error(f"Failed to delete vectors for book {book_id}: {str(e)}")
             raise VectorStoreException(f"Failed to delete vectors for book {book_id}: {str(e)}")
 
+    def _invalidate_search_cache(self, book_id: str) -> None:
+        """Drop cached search results for a book"""
+        self.search_cache.evict(lambda key: key[0] == book_id)
+
 qdrant_manager = QdrantManager()
\ No newline at end of file
@@ -5,7 +5,7 @@ import logging
 import os
 from contextvars import ContextVar
 from typing import Iterator
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import QueuePool
 from app.core.config import settings
@@ -18,42 +18,77 @@ db_dir = os.path.dirname(settings.SQLITE_DB_FILE)
 os.makedirs(db_dir, exist_ok=True)
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{settings.SQLITE_DB_FILE}"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=QueuePool,
-    pool_size=40,
-    max_overflow=40,
-    pool_timeout=60,
-    pool_recycle=1800,
-    pool_pre_ping=True
-)
+
+def _create_engine(pool_size: int, max_overflow: int):
+    """Engine on the database file with a pool of the given size"""
+    return create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=60,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        query_cache_size=1200  # compiled statement cache, sized for every route's queries with room to spare
+    )
+
+# sqlite takes one writer at a time, a single connection makes writers queue in the pool instead of on the file lock
+engine = _create_engine(pool_size=1, max_overflow=0)
+# wal readers never wait on the writer, one per threadpool worker running the read routes plus background sessions
+read_engine = _create_engine(pool_size=40, max_overflow=10)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocalRO = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 session_context: ContextVar[Session] = ContextVar("session_context")
 
+MMAP_SIZE = 268435456  # 256mb memory-mapped reads
+# whether the platform grants mmap, found out by the first connection
+_mmap_supported = None
+
 @event.listens_for(engine, "connect")
+@event.listens_for(read_engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
+    """Per-connection settings, journal_mode is stored in the database file and set once by initialise_db"""
+    global _mmap_supported
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")  # write-ahead log for better concurrency
     cursor.execute("PRAGMA synchronous=NORMAL")
-    cursor.execute("PRAGMA cache_size=10000")  # 10mb cache
+    cursor.execute("PRAGMA cache_size=-20000")  # 20mb page cache, reads are mostly served by mmap
     cursor.execute("PRAGMA temp_store=MEMORY")
-    cursor.execute("PRAGMA mmap_size=10000000000")  # 10gb storage for I/O
     cursor.execute("PRAGMA busy_timeout=30000")  # 30sec timeout if busy connection
+    cursor.execute("PRAGMA wal_autocheckpoint=1000")  # checkpoint every 1000 pages so the wal stays small
+
+    if _mmap_supported is not False:
+        granted = cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}").fetchone()
+        if _mmap_supported is None:
+            _mmap_supported = bool(granted and granted[0])
+            if not _mmap_supported: logger.info("SQLite memory-mapped I/O unavailable, using regular reads")
     cursor.close()
 
-def get_db() -> Iterator[Session]:
-    """Get database session dependency."""
-    db = SessionLocal()
+@event.listens_for(read_engine, "connect")
+def set_read_only(dbapi_connection, connection_record):
+    """Reject writes on reader connections"""
+    dbapi_connection.execute("PRAGMA query_only=1")
+
+def _session_scope(session_factory: sessionmaker) -> Iterator[Session]:
+    """Yield a session made current for the request, always closed afterwards"""
+    db = session_factory()
     token = session_context.set(db)
     try: yield db
     finally:
-        try:
-            session_context.reset(token)
-            db.close()
+        # closed first, the teardown may run in another context where the token cannot be reset
+        db.close()
+        try: session_context.reset(token)
         except ValueError: pass
 
+def get_db() -> Iterator[Session]:
+    """Get database session dependency."""
+    yield from _session_scope(SessionLocal)
+
+def get_ro_db() -> Iterator[Session]:
+    """Get read-only database session dependency, for routes that never write."""
+    yield from _session_scope(SessionLocalRO)
+
 def get_current_session() -> Session:
     """Get current active database session from context"""
     try:
@@ -61,10 +96,56 @@ def get_current_session() -> Session:
     except LookupError:
         raise DatabaseException("No database session found in current context")
 
+# columns that replace an older one, filled from it when first added: (table, new column) -> (old column, sql)
+_COLUMN_BACKFILLS = {
+    ("reading_progress", "completion_percentage_bp"): (
+        "completion_percentage",
+        "UPDATE reading_progress SET completion_percentage_bp = CAST(ROUND(completion_percentage * 100) AS INTEGER)"
+    ),
+}
+
+def _upgrade_schema():
+    """
+    Bring tables created by an older version of the schema up to date: add missing model columns and
+    indexes, and drop ix_ indexes the models no longer declare
+    """
+    # one connection throughout, the writer pool has no second one to give the inspector
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns: continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+                logger.info(f"Added missing column {table.name}.{column.name}")
+
+                backfill = _COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill and backfill[0] in existing_columns:
+                    connection.execute(text(backfill[1]))
+                    logger.info(f"Filled {table.name}.{column.name} from {backfill[0]}")
+
+        for table in Base.metadata.sorted_tables:
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            model_indexes = {index.name for index in table.indexes}
+            for name in existing_indexes - model_indexes:
+                if not name.startswith("ix_"): continue
+                connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+                logger.info(f"Dropped superseded index {name}")
+
+            for index in table.indexes:
+                if index.name in existing_indexes: continue
+                index.create(bind=connection)
+                logger.info(f"Created missing index {index.name}")
+
 def initialise_db():
     """Initialise db connections and create tables if they don't exist"""
     try:
+        with engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode=WAL")  # write-ahead log for better concurrency
+
         Base.metadata.create_all(bind=engine)
+        _upgrade_schema()
         logger.info("Database initialised - tables created if they didn't exist")
     except Exception as e:
         raise DatabaseException(f"Failed to initialize database: {str(e)}")
@@ -72,7 +153,10 @@ def initialise_db():
 def close_db_connection():
     """Close db connection"""
     try:
+        # refresh query planner statistics for the tables this process used
+        with engine.connect() as connection: connection.exec_driver_sql("PRAGMA optimize")
         engine.dispose()
+        read_engine.dispose()
         logger.info("Database connection closed")
     except Exception as e:
         logger.error(f"Failed to close database connection: {str(e)}")
\ No newline at end of file
@@ -64,11 +64,6 @@ class BookDetailResponse(BookBase):
     last_read_at: Optional[datetime] = None
     metadata: Optional[Dict[str, Any]] = Field(None, alias="book_metadata")
 
-    class Config:
-        """Pydantic config"""
-
-        from_attributes = True
-
 
 class EmbeddingStatusResponse(BaseModel):
     """Response model for embedding status"""
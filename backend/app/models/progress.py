@@ -1,9 +1,10 @@
 """
 MeReader Reading Progress Pydantic Models
 """
+import math
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 class ChapterInfo(BaseModel):
     """Model for chapter information"""
@@ -21,6 +22,20 @@ class ProgressResponse(BaseModel):
     current_chapter: Optional[ChapterInfo] = None
     last_read_at: Optional[datetime] = None
 
-    class Config:
-        """Pydantic config"""
-        from_attributes = True
\ No newline at end of file
+class ProgressUpdate(BaseModel):
+    """Request model for updating reading progress"""
+    current_location: Optional[int] = None
+    chapter_id: Optional[str] = None
+    completion_percentage: Optional[float] = None
+
+    @field_validator("current_location", mode="before")
+    @classmethod
+    def truncate_location(cls, value):
+        """Accept fractional or string locations, truncated to a whole location"""
+        if value is None: return None
+        # float() raises TypeError for lists and dicts, which pydantic would not turn into a validation error either
+        try: location = float(value)
+        except (TypeError, ValueError): raise ValueError("current_location must be a number")
+        # int() of an infinite float raises OverflowError, which pydantic would not turn into a validation error
+        if not math.isfinite(location): raise ValueError("current_location must be a finite number")
+        return int(location)
@@ -0,0 +1,298 @@
+"""
+MeReader BM25 Index - Okapi BM25 over an inverted index stored as memory-mapped NumPy arrays
+"""
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from functools import lru_cache
+from typing import List, Dict, Any
+import numpy as np
+import orjson
+
+try:
+    from numba import njit
+except ImportError:  # scoring falls back to numpy where numba is unavailable for the platform or numpy version
+    njit = None
+
+# files making up an index directory
+INDEX_FILE = "index.json"
+# chunk texts back to back as utf-8, located through chunk_offsets
+TEXTS_FILE = "texts.bin"
+# chunk metadata stored by field, values shared by every chunk once and the rest as one list per field
+METADATA_FILE = "metadata.json"
+ARRAY_FILES = ("indptr", "doc_ids", "weights", "locations", "chunk_offsets")
+# BM25Okapi defaults
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase word tokens, used for both indexed chunks and queries
+    Args:
+        text: Text to tokenize
+    Returns:
+        List of tokens
+    """
+    return _TOKEN_RE.findall(text.lower())
+
+if njit is not None:
+    # single threaded, a query's postings are small and the search worker processes already score queries side by side,
+    # a numba thread pool sized to every core in each of them would oversubscribe the cpu
+    @njit(fastmath=True, cache=True)
+    def _score_postings(indptr, doc_ids, weights, query_terms, out):
+        """Accumulate the precomputed BM25 weights of each query term's postings into out"""
+        for term in query_terms:
+            for p in range(indptr[term], indptr[term + 1]):
+                out[doc_ids[p]] += weights[p]
+else:
+    _score_postings = None
+
+def _metadata_columns(chunks: List[str], metadata: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Lay chunk metadata out by field instead of one dict per chunk
+    Args:
+        chunks: Text of each chunk
+        metadata: Metadata of each chunk
+    Returns:
+        Fields with the same value on every chunk, one list per remaining field with None where a chunk lacks it,
+        and whether each chunk's metadata repeats its text
+    """
+    keys = list(dict.fromkeys(key for meta in metadata for key in meta))
+    # the text field is dropped when it only repeats the chunk text
+    text_in_metadata = bool(metadata) and all(meta.get("text") == text for text, meta in zip(chunks, metadata))
+    if text_in_metadata: keys.remove("text")
+
+    shared, columns = {}, {}
+    for key in keys:
+        column = [meta.get(key) for meta in metadata]
+        if all(key in meta for meta in metadata) and column.count(column[0]) == len(column): shared[key] = column[0]
+        else: columns[key] = column
+
+    return {"shared": shared, "columns": columns, "text_in_metadata": text_in_metadata}
+
+class BM25Index:
+    """
+    BM25 index of a book's text chunks, scoring matches rank_bm25's BM25Okapi with its default parameters
+    Postings are stored per term: the documents containing term t are doc_ids[indptr[t]:indptr[t + 1]]
+    with the term's full BM25 weight in each of them at the same positions in weights,
+    so scoring a query only sums weights
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, INDEX_FILE), "rb") as f: index = orjson.loads(f.read())
+
+        self.vocabulary: Dict[str, int] = index["vocabulary"]
+
+        # pages are shared through the os page cache instead of being copied into every process
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r") for name in ARRAY_FILES}
+        self.indptr = arrays["indptr"]
+        self.doc_ids = arrays["doc_ids"]
+        self.weights = arrays["weights"]
+        self.locations = arrays["locations"]
+        self.chunk_offsets = arrays["chunk_offsets"]
+
+        # chunk texts stay on disk, only the ones a search returns are decoded
+        with open(os.path.join(index_dir, TEXTS_FILE), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        with open(os.path.join(index_dir, METADATA_FILE), "rb") as f: metadata = orjson.loads(f.read())
+        self.shared_metadata: Dict[str, Any] = metadata["shared"]
+        self.metadata_columns: Dict[str, List[Any]] = metadata["columns"]
+        # a chunk's metadata holds its text under this key, left out of the columns as it repeats the texts file
+        self.text_in_metadata: bool = metadata["text_in_metadata"]
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def chunk(self, i: int) -> Dict[str, Any]:
+        """
+        Decode one chunk and gather its metadata from the columns
+        Args:
+            i: Index of the chunk
+        Returns:
+            Dictionary with the chunk's text and metadata
+        """
+        text = self.texts[self.chunk_offsets[i]:self.chunk_offsets[i + 1]].decode("utf-8")
+        metadata = dict(self.shared_metadata)
+        for key, column in self.metadata_columns.items():
+            if column[i] is not None: metadata[key] = column[i]
+        if self.text_in_metadata: metadata["text"] = text
+        return {"text": text, "metadata": metadata}
+
+    def get_scores(self, tokenized_query: List[str]) -> np.ndarray:
+        """
+        Score every chunk against a query
+        Args:
+            tokenized_query: Query tokens, repeated tokens count once per occurrence as in BM25Okapi
+        Returns:
+            Array of scores aligned with the chunks
+        """
+        scores = np.zeros(len(self), dtype=np.float64)
+        query_terms = np.fromiter(
+            (term for term in map(self.vocabulary.get, tokenized_query) if term is not None), dtype=np.int64
+        )
+        if not query_terms.size: return scores
+
+        if _score_postings is not None:
+            _score_postings(np.asarray(self.indptr), np.asarray(self.doc_ids), np.asarray(self.weights), query_terms, scores)
+            return scores
+
+        for term in query_terms.tolist():
+            start, end = self.indptr[term], self.indptr[term + 1]
+            # a term's postings never repeat a document, so plain fancy indexing accumulates correctly
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        return scores
+
+    def top_k(self, scores: np.ndarray, location_boundary: int, limit: int) -> np.ndarray:
+        """
+        Select the best scoring chunks up to a location
+        Args:
+            scores: Scores from get_scores
+            location_boundary: Maximum chunk location to include
+            limit: Maximum number of chunks to return
+        Returns:
+            Indices of chunks with a positive score, best first
+        """
+        candidates = np.flatnonzero((self.locations <= location_boundary) & (scores > 0))
+        k = min(limit, candidates.size)
+        if k == 0: return candidates[:0]
+
+        # partial selection first, only the k survivors get sorted
+        top = np.sort(candidates[np.argpartition(-scores[candidates], k - 1)[:k]])
+        # stable over sorted indices, equal scores keep chunk order
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    @staticmethod
+    def build(
+            index_dir: str,
+            tokenized_chunks: List[List[str]],
+            chunks: List[str],
+            metadata: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Build an index and write it to a directory, replacing any index already there
+        Args:
+            index_dir: Directory to write the index to
+            tokenized_chunks: Tokens of each chunk
+            chunks: Text of each chunk
+            metadata: Metadata of each chunk
+        """
+        n_docs = len(tokenized_chunks)
+        # every token hashed once to an int32 term id, the rest of the build only touches integer arrays
+        vocabulary: Dict[str, int] = {}
+        term_ids = np.fromiter(
+            (vocabulary.setdefault(token, len(vocabulary)) for tokens in tokenized_chunks for token in tokens),
+            dtype=np.int64
+        )
+        doc_lens = np.fromiter((len(tokens) for tokens in tokenized_chunks), dtype=np.int64, count=n_docs)
+
+        # distinct (term, doc) pairs sorted term first, which is the postings order
+        pairs, counts = np.unique(term_ids * n_docs + np.repeat(np.arange(n_docs), doc_lens), return_counts=True)
+        doc_freqs = np.bincount(pairs // n_docs, minlength=len(vocabulary))
+
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        # same idf as BM25Okapi, negative values floored at a fraction of the average
+        idf = np.log(n_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        if idf.size: idf[idf < 0] = EPSILON * idf.mean()
+
+        # each posting's weight, the term's idf times its saturated, length normalised frequency in the document
+        doc_ids = (pairs % n_docs).astype(np.int32)
+        # without any tokens there are no postings to weigh, the average is kept out of a 0 / 0
+        avgdl = doc_lens.mean() if doc_lens.any() else 1.0
+        length_norm = K1 * (1 - B + B * doc_lens / avgdl)
+        weights = np.repeat(idf, doc_freqs) * counts * (K1 + 1) / (counts + length_norm[doc_ids])
+
+        arrays = {
+            "indptr": indptr,
+            "doc_ids": doc_ids,
+            "weights": weights,
+            # chunk locations, so the reading position filter runs on the array instead of the metadata dicts
+            "locations": np.fromiter((meta.get("location", 0) for meta in metadata), dtype=np.int32, count=len(metadata))
+        }
+
+        encoded_chunks = [text.encode("utf-8") for text in chunks]
+        arrays["chunk_offsets"] = np.zeros(len(encoded_chunks) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded_chunks], out=arrays["chunk_offsets"][1:])
+
+        # written next to the target and swapped in, a reader never sees a half written index
+        parent_dir = os.path.dirname(os.path.abspath(index_dir))
+        build_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".bm25-")
+        # the old index is moved aside and only deleted once the new one is in place
+        old_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".bm25-old-")
+        replaced_dir = os.path.join(old_dir, "index")
+        try:
+            for name, array in arrays.items(): np.save(os.path.join(build_dir, f"{name}.npy"), array)
+
+            with open(os.path.join(build_dir, INDEX_FILE), "wb") as f: f.write(orjson.dumps({"vocabulary": vocabulary}))
+            with open(os.path.join(build_dir, TEXTS_FILE), "wb") as f: f.writelines(encoded_chunks)
+            with open(os.path.join(build_dir, METADATA_FILE), "wb") as f: f.write(orjson.dumps(_metadata_columns(chunks, metadata)))
+
+            if os.path.exists(index_dir): os.replace(index_dir, replaced_dir)
+            try:
+                os.replace(build_dir, index_dir)
+            except Exception:
+                # the previous index goes back rather than leaving none
+                if os.path.exists(replaced_dir): os.replace(replaced_dir, index_dir)
+                raise
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        finally:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+def build_index(index_dir: str, chunks: List[str], metadata: List[Dict[str, Any]]) -> None:
+    """
+    Tokenize chunks and build their index, runs in a worker process so it takes only picklable values
+    Args:
+        index_dir: Directory to write the index to
+        chunks: Text of each chunk
+        metadata: Metadata of each chunk
+    """
+    BM25Index.build(index_dir, [tokenize(chunk) for chunk in chunks], chunks, metadata)
+
+@lru_cache(maxsize=8)
+def open_index(index_dir: str, mtime: float) -> BM25Index:
+    """Open a BM25 index directory, cached per directory and modification time so a rebuilt index is picked up"""
+    return BM25Index(index_dir)
+
+def score_and_rank(
+        index_dir: str,
+        mtime: float,
+        tokenized_query: List[str],
+        location_boundary: int,
+        limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Score a query against an index and build the results of the best chunks
+    Runs in the search worker processes, takes and returns only picklable values
+    Args:
+        index_dir: Index directory
+        mtime: Modification time of the index directory
+        tokenized_query: Query tokens
+        location_boundary: Maximum chunk location to include
+        limit: Maximum number of results
+    Returns:
+        Results best first, scores normalised so the best is 0.95
+    """
+    index = open_index(index_dir, mtime)
+    scores = index.get_scores(tokenized_query)
+
+    # only the selected chunks are turned into result dicts
+    top = index.top_k(scores, location_boundary, limit)
+    if not top.size: return []
+
+    normalised_scores = scores[top] / scores[top[0]] * 0.95
+    results = []
+    for i, score in zip(top.tolist(), normalised_scores.tolist()):
+        record = index.chunk(i)
+        results.append({"score": score, "text": record["text"], **record["metadata"]})
+    return results
@@ -1,25 +1,89 @@
 """
 MeReader Book Service - EPUB Parsing and Processing
 """
+import io
+import itertools
 import logging
+import multiprocessing
 import os
 import shutil
-import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from importlib import metadata
 from pathlib import Path
-from typing import Dict, List, Any, Tuple, Optional
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Any, Tuple, Optional
 import re
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 from PIL import Image
 from app.core.config import settings
 from app.core.exceptions import BookParsingException, FileStorageException
+from app.db.models import generate_id
 from app.services.location_service import LocationService
-from app.services.content_service import ContentService
+from app.services.content_service import ContentService, CONTENT_PACK_FILENAME
+from app.services.epub_archive import EpubArchive, ITEM_COVER, ITEM_DOCUMENT, ITEM_IMAGE
 
 logger = logging.getLogger(__name__)
 
+# chapter title detection for spine items without a toc entry
+_TITLE_PATTERNS = [
+    re.compile(r'^(Prologue|Epilogue|Afterword|Foreword|Introduction|Preface|Appendix|Notes)[\s\:\.\n]', re.IGNORECASE),
+    re.compile(r'^(Chapter|Section)\s+([IVXLCDM]+|[0-9]+)[\s\:\.\n]', re.IGNORECASE),  # Roman and Arabic numerals
+]
+# characters of chapter text the title heuristics search
+_TITLE_SEARCH_CHARS = 2048
+_TITLE_SENTENCE_RE = re.compile(r'^.*?[\.\!\?](?=\s|$)')
+_FILENAME_CHAPTER_RE = re.compile(r'(chapter[_\-\s]?(\d+)|epilogue|prologue)')
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w\.\-]')
+
+# spine chapter title lookups, tried in this order
+_HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+_HEADING_XPATH = etree.XPath('(//h1|//h2|//h3|//h4)[1]')
+_TITLE_ELEMENT_XPATH = etree.XPath('(//title)[1]')
+# div or section whose id or class mentions a title, heading or chapter, matched case-insensitively
+_TITLED_BLOCK_XPATH = etree.XPath(
+    '(//div|//section)[%s][1]' % ' or '.join(
+        f'contains(translate(concat(@id, " ", @class), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "{word}")'
+        for word in ('title', 'heading', 'chapter')
+    )
+)
+
+_JPEG_MEDIA_TYPES = frozenset(('image/jpeg', 'image/jpg'))
+_JPEG_MAGIC = b'\xff\xd8\xff'
+
+# chapter html is cleaned up in worker processes, the tree walk holds the gil
+# spawned rather than forked, the workers only import the content service
+_CHAPTER_EXECUTOR = ProcessPoolExecutor(
+    max_workers=os.cpu_count() or 1,
+    mp_context=multiprocessing.get_context("spawn")
+)
+# chapters submitted ahead of the one being written, enough to keep every worker busy
+_CHAPTER_WINDOW = 2 * (os.cpu_count() or 1)
+
+def _leading_text(document: lxml.html.HtmlElement, limit: int = _TITLE_SEARCH_CHARS) -> str:
+    """
+    Start of a document's text, leading whitespace skipped
+    Args:
+        document: Parsed document
+        limit: Maximum number of characters
+    Returns:
+        Up to limit characters of text
+    """
+    parts, size = [], 0
+    for text in document.itertext():
+        if not parts:
+            text = text.lstrip()
+            if not text: continue
+        parts.append(text)
+        size += len(text)
+        if size >= limit: break
+    return ''.join(parts)[:limit]
+
+def _pillow_variant() -> str:
+    """Name and version of the installed Pillow build, pillow-simd installs under its own distribution name"""
+    try: return f"pillow-simd {metadata.version('pillow-simd')}"
+    except metadata.PackageNotFoundError: return f"Pillow {metadata.version('Pillow')}"
+
 class BookService:
     """Service for parsing and processing EPUB files"""
 
@@ -30,33 +94,33 @@ class BookService:
         self.content_service = ContentService()
         self.location_service = LocationService()
 
-        os.makedirs(self.upload_dir, exist_ok=True)
-        os.makedirs(self.content_dir, exist_ok=True)
-        os.makedirs(self.cover_dir, exist_ok=True)
-
         logger.info(f"Book service initialised with upload directory: {self.upload_dir}")
+        logger.info(f"Cover images processed with {_pillow_variant()}")
 
-    def _extract_metadata(self, book: epub.EpubBook) -> Dict[str, Any]:
+    def _extract_metadata(self, book: EpubArchive) -> Dict[str, Any]:
         """
         Extract metadata from EPUB
         Args:
-            book: EpubBook object
+            book: Opened EPUB archive
         Returns:
             Dictionary with metadata
         """
-        metadata = {'title': book.get_metadata('DC', 'title')[0][0] if book.get_metadata('DC', 'title') else "Unknown Title",
-                    'author': book.get_metadata('DC', 'creator')[0][0] if book.get_metadata('DC', 'creator') else "Unknown Author",
-                    'language': book.get_metadata('DC', 'language')[0][0] if book.get_metadata('DC', 'language') else None,
-                    'publisher': book.get_metadata('DC', 'publisher')[0][0] if book.get_metadata('DC', 'publisher') else None,
-                    'description': book.get_metadata('DC', 'description')[0][0] if book.get_metadata('DC', 'description') else None}
+        def dc_value(field: str, default: Optional[str] = None) -> Optional[str]:
+            values = book.get_metadata('DC', field)
+            return values[0][0] if values else default
+
+        metadata = {'title': dc_value('title', "Unknown Title"),
+                    'author': dc_value('creator', "Unknown Author"),
+                    'language': dc_value('language'),
+                    'publisher': dc_value('publisher'),
+                    'description': dc_value('description')}
         # isbn
-        identifiers = book.get_metadata('DC', 'identifier')
-        if identifiers: metadata['isbn'] = identifiers[0][0]
+        isbn = dc_value('identifier')
+        if isbn: metadata['isbn'] = isbn
 
         # publication date
-        dates = book.get_metadata('DC', 'date')
-        if dates:
-            date_str = dates[0][0]
+        date_str = dc_value('date')
+        if date_str:
             try:
                 if '-' in date_str: metadata['published_year'] = int(date_str.split('-')[0])
                 elif '/' in date_str: metadata['published_year'] = int(date_str.split('/')[0])
@@ -65,11 +129,11 @@ class BookService:
 
         return metadata
 
-    def _extract_cover(self, book: epub.EpubBook, book_id: str) -> Optional[str]:
+    def _extract_cover(self, book: EpubArchive, book_id: str) -> Optional[str]:
         """
         Extract cover image from EPUB book
         Args:
-            book: EpubBook object
+            book: Opened EPUB archive
             book_id: ID of the book for file naming
         Returns:
             Path to the extracted cover image or None
@@ -79,20 +143,20 @@ class BookService:
 
             # 1: cover item
             for item in book.get_items():
-                if item.get_type() == ebooklib.ITEM_COVER:
+                if item.get_type() == ITEM_COVER:
                     cover_image = item
                     break
 
             # 2: image with 'cover' in ID
             if not cover_image:
-                for item in book.get_items_of_type(ebooklib.ITEM_IMAGE):
+                for item in book.get_items_of_type(ITEM_IMAGE):
                     if 'cover' in item.id.lower():
                         cover_image = item
                         break
 
             # 3: first image in the book
             if not cover_image:
-                for item in book.get_items_of_type(ebooklib.ITEM_IMAGE):
+                for item in book.get_items_of_type(ITEM_IMAGE):
                     cover_image = item
                     break
 
@@ -100,10 +164,16 @@ class BookService:
                 cover_filename = f"{book_id}_cover.jpg"
                 cover_path = os.path.join(self.cover_dir, cover_filename)
 
-                with open(cover_path, 'wb') as f: f.write(cover_image.get_content())
-                img = Image.open(cover_path)
-                if img.mode == 'RGBA': img = img.convert('RGB')
-                img.save(cover_path, 'JPEG')
+                content = cover_image.get_content()
+                # a jpeg cover is written as it is, re-encoding would only cost time and quality
+                if cover_image.media_type in _JPEG_MEDIA_TYPES and content.startswith(_JPEG_MAGIC):
+                    with open(cover_path, 'wb') as f: f.write(content)
+                    return cover_path
+
+                # anything else is decoded from memory and written once, as jpeg
+                img = Image.open(io.BytesIO(content))
+                if img.mode not in ('RGB', 'L', 'CMYK'): img = img.convert('RGB')
+                img.save(cover_path, 'JPEG', quality=85, optimize=True)
 
                 return cover_path
 
@@ -113,30 +183,51 @@ class BookService:
             logger.warning(f"Failed to extract cover image: {str(e)}")
             return None
 
-    def _extract_content(self, book: epub.EpubBook) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    def _iter_content(self, book: EpubArchive, book_title: str) -> Iterator[Tuple[Dict[str, Any], str]]:
         """
-        Extract chapters and content from EPUB book
+        Extract chapters and content from EPUB book, one chapter at a time
         Args:
-            book: EpubBook object
+            book: Opened EPUB archive
+            book_title: Title of the single chapter made when the book has no documents
         Returns:
-            Tuple of (chapters list, content by chapter dict)
+            Iterator of (chapter, processed html) pairs in chapter order
         """
-        chapters = []
-        content_by_chapter = {}
         all_items = {}
         toc_items = set()
 
+        # spine position of every item id, first occurrence wins, looked up per toc entry
+        spine_index_by_id = {}
+
         # processing all items in spine
         for spine_index, spine_id in enumerate(book.spine):
             if isinstance(spine_id, tuple): spine_id = spine_id[0]
+            spine_index_by_id.setdefault(spine_id, spine_index)
             if spine_id.startswith('nav'): continue
             item = book.get_item_with_id(spine_id)
-            if item and item.get_type() == ebooklib.ITEM_DOCUMENT: all_items[spine_index] = item
+            if item and item.get_type() == ITEM_DOCUMENT: all_items[spine_index] = item
 
+        # (chapter, item) pairs, the documents are only read once the chapters are processed
         toc_chapters = []
 
+        def emit_chapter(href, title, order):
+            """Add the toc entry's document as a chapter, if it is in the spine"""
+            item = book.get_item_with_href(href)
+            if not item: return
+
+            spine_index = spine_index_by_id.get(item.id)
+            if spine_index is None: return
+
+            toc_items.add(item.id)
+            chapter_id = f"ch{len(toc_chapters) + 1}"
+            toc_chapters.append(({
+                'id': chapter_id,
+                'title': title,
+                'order': order,
+                'href': item.file_name,
+                'spine_index': spine_index
+            }, item))
+
         def process_toc_entries(entries, parent_order=0):
-            nonlocal toc_chapters, toc_items
             order = parent_order * 100
 
             for entry in entries:
@@ -145,110 +236,81 @@ class BookService:
                     title, href = entry[0], entry[1]
                     if href:
                         order += 1
-                        item = book.get_item_with_href(href)
-                        if item:
-                            spine_index = None
-                            for i, spine_id in enumerate(book.spine):
-                                if isinstance(spine_id, tuple): spine_id = spine_id[0]
-                                if spine_id == item.id:
-                                    spine_index = i
-                                    break
-
-                            if spine_index is not None:
-                                toc_items.add(item.id)
-                                chapter_id = f"ch{len(toc_chapters) + 1}"
-                                chapter = {
-                                    'id': chapter_id,
-                                    'title': title,
-                                    'order': order,
-                                    'href': item.file_name,
-                                    'spine_index': spine_index
-                                }
-                                toc_chapters.append(chapter)
-
-                                html_content = item.get_content().decode('utf-8')
-                                processed_html = self.content_service.process_html_content(html_content)
-                                content_by_chapter[chapter_id] = processed_html
+                        emit_chapter(href, title, order)
 
                 elif isinstance(entry, list): process_toc_entries(entry, parent_order=order)
 
                 elif hasattr(entry, 'title') and hasattr(entry, 'href'):
                     order += 1
-                    href = entry.href
-                    item = book.get_item_with_href(href)
-                    if item:
-                        spine_index = None
-                        for i, spine_id in enumerate(book.spine):
-                            if isinstance(spine_id, tuple): spine_id = spine_id[0]
-                            if spine_id == item.id:
-                                spine_index = i
-                                break
-
-                        if spine_index is not None:
-                            toc_items.add(item.id)
-                            chapter_id = f"ch{len(toc_chapters) + 1}"
-                            chapter = {
-                                'id': chapter_id,
-                                'title': entry.title,
-                                'order': order,
-                                'href': item.file_name,
-                                'spine_index': spine_index
-                            }
-                            toc_chapters.append(chapter)
-
-                            html_content = item.get_content().decode('utf-8')
-                            processed_html = self.content_service.process_html_content(html_content)
-                            content_by_chapter[chapter_id] = processed_html
+                    emit_chapter(entry.href, entry.title, order)
 
         if book.toc: process_toc_entries(book.toc)
         if len(toc_chapters) > 0:
             logger.info(f"Using {len(toc_chapters)} chapters from TOC")
-            return toc_chapters, content_by_chapter
-
-        spine_chapters = []
-        spine_content = {}
+            yield from self._process_chapter_html(
+                (chapter, item.get_content().decode('utf-8')) for chapter, item in toc_chapters
+            )
+            return
+
+        # every spine document becomes a chapter
+        if not all_items:
+            logger.warning("No chapters found, creating a single empty chapter")
+            yield {'id': 'ch1', 'title': book_title, 'order': 1, 'href': None, 'spine_index': 0}, ""
+            return
+
+        logger.info(f"Using {len(all_items)} chapters from spine")
+        yield from self._process_chapter_html(self._iter_spine_chapters(all_items))
+
+    @staticmethod
+    def _iter_spine_chapters(all_items: Dict[int, Any]) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """
+        Title every spine document, for books whose table of contents names no chapters
+        Args:
+            all_items: Document items by spine position
+        Returns:
+            Iterator of (chapter, raw html) pairs in spine order
+        """
         for spine_index, item in sorted(all_items.items()):
-            html_content = item.get_content().decode('utf-8')
-            soup = BeautifulSoup(html_content, 'html.parser')
+            raw_content = item.get_content()
+            html_content = raw_content.decode('utf-8')
+            document = lxml.html.document_fromstring(raw_content, parser=_HTML_PARSER)
 
+            # each lookup is one compiled xpath, evaluated in c
             title = None
-            for heading in soup.find_all(['h1', 'h2', 'h3', 'h4'], limit=1):
-                title = heading.get_text().strip()
-                break
+            heading = _HEADING_XPATH(document)
+            if heading: title = heading[0].text_content().strip()
 
+            # the title element lives in the head, looked up before the head is dropped
             if not title:
-                title_elem = soup.find('title')
-                if title_elem: title = title_elem.get_text().strip()
+                title_elem = _TITLE_ELEMENT_XPATH(document)
+                if title_elem: title = title_elem[0].text_content().strip()
+
+            # the remaining lookups read the body only
+            etree.strip_elements(document, 'head', 'script', 'style', with_tail=False)
 
             if not title:
-                for elem in soup.find_all(['div', 'section']):
-                    elem_id = elem.get('id', '').lower()
-                    elem_class = ' '.join(elem.get('class', [])).lower()
-                    if any(word in elem_id or word in elem_class for word in ['title', 'heading', 'chapter']):
-                        title = elem.get_text().strip()
-                        break
+                titled_block = _TITLED_BLOCK_XPATH(document)
+                if titled_block: title = titled_block[0].text_content().strip()
+            # the text heuristics only look at the start of the chapter, the rest of its text is never built
+            if not title: leading_text = _leading_text(document)
+
             if not title or title == "":
-                content_text = soup.get_text().strip()
-                patterns = [
-                    r'^(Prologue|Epilogue|Afterword|Foreword|Introduction|Preface|Appendix|Notes)[\s\:\.\n]',
-                    r'^(Chapter|Section)\s+([IVXLCDM]+|[0-9]+)[\s\:\.\n]',  # Roman and Arabic numerals
-                ]
-
-                for pattern in patterns:
-                    match = re.search(pattern, content_text, re.IGNORECASE)
+                content_text = leading_text.rstrip()
+                for pattern in _TITLE_PATTERNS:
+                    match = pattern.search(content_text)
                     if match:
-                        title_para = re.search(r'^.*?[\.\!\?](?=\s|$)', content_text)
+                        title_para = _TITLE_SENTENCE_RE.search(content_text)
                         if title_para: title = title_para.group(0).strip()
                         else: title = match.group(0).strip()
                         break
 
             if not title or title == "":
-                match = re.search(r'(chapter[_\-\s]?(\d+)|epilogue|prologue)', item.file_name.lower())
+                match = _FILENAME_CHAPTER_RE.search(item.file_name.lower())
                 if match:
                     title_type = match.group(1)
                     if 'chapter' in title_type and match.group(2):
                         chap_num = match.group(2)
-                        chapter_pattern = re.search(r'Chapter\s+' + chap_num + r'[:\.\s]+(.*?)[\.\!\?](?=\s|$)', soup.get_text(), re.IGNORECASE)
+                        chapter_pattern = re.search(r'Chapter\s+' + chap_num + r'[:\.\s]+(.*?)[\.\!\?](?=\s|$)', leading_text, re.IGNORECASE)
                         if chapter_pattern and chapter_pattern.group(1).strip(): title = f"Chapter {chap_num}: {chapter_pattern.group(1).strip()}"
                         else: title = f"Chapter {chap_num}"
                     else: title = title_type.capitalize()
@@ -263,49 +325,60 @@ class BookService:
                 'href': item.file_name,
                 'spine_index': spine_index
             }
-            spine_chapters.append(chapter)
-
-            processed_html = self.content_service.process_html_content(html_content)
-            spine_content[chapter_id] = processed_html
-
-        if len(spine_chapters) > 0:
-            logger.info(f"Using {len(spine_chapters)} chapters from spine")
-            return spine_chapters, spine_content
-        else:
-            logger.warning("No chapters found, creating a single chapter with all content")
-            all_content = ""
-            for spine_index, item in sorted(all_items.items()):
-                html_content = item.get_content().decode('utf-8')
-                all_content += self.content_service.process_html_content(html_content)
-
-            single_chapter = {
-                'id': 'ch1',
-                'title': metadata.get('title', 'Full Content'),
-                'order': 1,
-                'href': None,
-                'spine_index': 0
-            }
-            return [single_chapter], {'ch1': all_content}
+            yield chapter, html_content
 
-    def _extract_book_images(self, book: epub.EpubBook, book_content_dir: str) -> Dict[str, str]:
+    @staticmethod
+    def _process_chapter_html(
+            chapters: Iterable[Tuple[Dict[str, Any], str]]
+    ) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """
+        Clean up the html of every chapter, spread over the chapter worker processes
+        Only a bounded window of chapters is in flight, so the raw and processed html of the whole book is never held at once
+        Args:
+            chapters: (chapter, raw html) pairs
+        Returns:
+            Iterator of (chapter, processed html) pairs, in the same order
+        """
+        chapters = iter(chapters)
+        first = list(itertools.islice(chapters, 2))
+        if len(first) < 2:
+            for chapter, html_content in first: yield chapter, ContentService.process_html_content(html_content)
+            return
+
+        pending = deque()
+        for chapter, html_content in itertools.chain(first, chapters):
+            pending.append((chapter, _CHAPTER_EXECUTOR.submit(ContentService.process_html_content, html_content)))
+            if len(pending) >= _CHAPTER_WINDOW:
+                chapter, future = pending.popleft()
+                yield chapter, future.result()
+
+        while pending:
+            chapter, future = pending.popleft()
+            yield chapter, future.result()
+
+    def _extract_book_images(self, book: EpubArchive, book_content_dir: str) -> Dict[str, str]:
         """
         Extract images from EPUB book and save them in the book content directory
         Args:
-            book: EpubBook object
+            book: Opened EPUB archive
             book_content_dir: Directory where book content is stored
         Returns:
             Dictionary mapping from image IDs/paths to filenames
         """
         image_mapping = {}
         os.makedirs(book_content_dir, exist_ok=True)
+        # joined once, each image path is a plain concatenation
+        path_prefix = book_content_dir + os.sep
 
-        for item in book.get_items_of_type(ebooklib.ITEM_IMAGE):
+        for item in book.get_items_of_type(ITEM_IMAGE):
             try:
-                img_filename = os.path.basename(item.file_name)
-                img_filename = re.sub(r'[^\w\.\-]', '_', img_filename)
-                img_path = os.path.join(book_content_dir, img_filename)
+                # zip entry names always use forward slashes
+                img_filename = item.file_name.rsplit('/', 1)[-1]
+                img_filename = _UNSAFE_FILENAME_RE.sub('_', img_filename)
+                img_path = path_prefix + img_filename
 
-                with open(img_path, 'wb') as f: f.write(item.get_content())
+                # streamed out of the zip in 64kb pieces, a large image is never held in memory whole
+                with item.open() as src, open(img_path, 'wb') as f: shutil.copyfileobj(src, f, length=1 << 16)
 
                 image_mapping[item.file_name] = img_filename
                 if item.id:
@@ -317,11 +390,11 @@ class BookService:
 
         return image_mapping
 
-    def save_uploaded_file(self, file_content: bytes, filename: str) -> str:
+    def save_uploaded_file(self, file_obj: BinaryIO, filename: str) -> str:
         """
-        Save uploaded EPUB file to disk
+        Save uploaded EPUB file to disk, streaming it in fixed-size chunks
         Args:
-            file_content: EPUB file content as bytes
+            file_obj: Readable binary file object with the EPUB content
             filename: Original filename
         Returns:
             Path to the saved file
@@ -329,21 +402,22 @@ class BookService:
         try:
             if not filename.lower().endswith('.epub'): filename = f"{Path(filename).stem}.epub"
             safe_filename = filename.replace(' ', '_')
-            file_path = os.path.join(self.upload_dir, safe_filename)
-
-            counter = 1
-            while os.path.exists(file_path):
-                name_parts = Path(safe_filename).stem.rsplit('_', 1)
-                if len(name_parts) > 1 and name_parts[-1].isdigit():
-                    base_name = name_parts[0]
-                    counter = int(name_parts[-1]) + 1
-                else: base_name = Path(safe_filename).stem
-
-                new_filename = f"{base_name}_{counter}.epub"
-                file_path = os.path.join(self.upload_dir, new_filename)
-                counter += 1
+            name_parts = Path(safe_filename).stem.rsplit('_', 1)
+            if len(name_parts) > 1 and name_parts[-1].isdigit(): base_name, first_counter = name_parts[0], int(name_parts[-1]) + 1
+            else: base_name, first_counter = Path(safe_filename).stem, 1
+
+            # each name is claimed with O_EXCL, one syscall per candidate and two uploads never get the same path
+            candidates = itertools.chain(
+                [safe_filename], (f"{base_name}_{counter}.epub" for counter in itertools.count(first_counter))
+            )
+            for candidate in candidates:
+                file_path = os.path.join(self.upload_dir, candidate)
+                try:
+                    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+                    break
+                except FileExistsError: continue
 
-            with open(file_path, "wb") as f: f.write(file_content)
+            with os.fdopen(fd, "wb") as f: shutil.copyfileobj(file_obj, f, length=1024 * 1024)
             logger.info(f"EPUB file saved to {file_path}")
 
             return file_path
@@ -364,13 +438,14 @@ class BookService:
         """
         try:
             logger.info(f"Parsing EPUB file: {file_path}")
-            book = epub.read_epub(file_path)
+            # entries are read from the zip as they are needed, the archive stays open until parsing is done
+            book = EpubArchive(file_path)
 
             metadata = self._extract_metadata(book)
             logger.info(f"Extracted metadata for book: {metadata.get('title', 'Unknown')}")
 
             # book uuid
-            book_id = str(uuid.uuid4())
+            book_id = generate_id()
             book_content_dir = os.path.join(self.content_dir, book_id)
             os.makedirs(book_content_dir, exist_ok=True)
             image_mapping = self._extract_book_images(book, book_content_dir)
@@ -381,36 +456,39 @@ class BookService:
                 metadata['cover_path'] = cover_path
                 logger.info(f"Extracted cover image to {cover_path}")
 
-            chapters, content_by_chapter = self._extract_content(book)
-            logger.info(f"Extracted {len(chapters)} chapters and content")
-
             # processing chapters and locations
             processed_chapters = []
             total_locations = 0
 
-            for chapter in chapters:
-                chapter_content = content_by_chapter.get(chapter['id'], "")
-                chapter_filename = f"chapter_{chapter['order']}.html"
-                chapter_path = os.path.join(book_content_dir, chapter_filename)
-
-                with open(chapter_path, "w", encoding="utf-8") as f: f.write(chapter_content)
-
-                # calculating location info
-                start_location = total_locations + 1
-                char_count = len(chapter_content)
-                locations_in_chapter = self.location_service.calculate_locations(chapter_content)
-                end_location = start_location + locations_in_chapter - 1
-                total_locations += locations_in_chapter
-
-                # updating chapter with location and path info
-                processed_chapter = {
-                    **chapter,
-                    'content_path': chapter_path,
-                    'start_location': start_location,
-                    'end_location': end_location,
-                    'char_count': char_count
-                }
-                processed_chapters.append(processed_chapter)
+            # chapters are packed back to back into one file, every chapter read is served from its memory map
+            pack_path = os.path.join(book_content_dir, CONTENT_PACK_FILENAME)
+            with open(pack_path, "wb", buffering=1 << 16) as pack_file:
+                # each chapter is written as soon as it is processed, then let go
+                for chapter, chapter_content in self._iter_content(book, metadata.get('title', 'Full Content')):
+                    encoded_content = chapter_content.encode("utf-8")
+                    content_offset = pack_file.tell()
+                    pack_file.write(encoded_content)
+
+                    # calculating location info
+                    start_location = total_locations + 1
+                    char_count = len(chapter_content)
+                    locations_in_chapter = self.location_service.calculate_locations(chapter_content)
+                    end_location = start_location + locations_in_chapter - 1
+                    total_locations += locations_in_chapter
+
+                    # updating chapter with location and path info
+                    processed_chapter = {
+                        **chapter,
+                        'content_path': pack_path,
+                        'start_location': start_location,
+                        'end_location': end_location,
+                        'char_count': char_count,
+                        'content_offset': content_offset,
+                        'content_size': len(encoded_content)
+                    }
+                    processed_chapters.append(processed_chapter)
+
+            logger.info(f"Extracted {len(processed_chapters)} chapters and content")
 
             index_path = self.content_service.create_index_file(book_content_dir, metadata, processed_chapters)
             metadata_path = self.content_service.save_metadata_file(book_content_dir, metadata, processed_chapters)
@@ -433,4 +511,7 @@ class BookService:
             if 'book_content_dir' in locals() and os.path.exists(book_content_dir): shutil.rmtree(book_content_dir)
             raise BookParsingException(f"Failed to parse EPUB file: {str(e)}")
 
+        finally:
+            if 'book' in locals(): book.close()
+
 book_service = BookService()
\ No newline at end of file
@@ -1,112 +1,245 @@
 """
 MeReader Content Service for managing extracted book content
 """
+import functools
+import html
+import io
 import logging
+import mmap
 import os
-import json
 import re
-from typing import Dict, List, Any
-from bs4 import BeautifulSoup, Comment
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional
+import orjson
+import lxml.html
+from lxml import etree
 from app.core.config import settings
 from app.services.text_extraction_utility import text_extraction_util
 
 logger = logging.getLogger(__name__)
 
+# file in each book content directory holding every chapter's html back to back
+CONTENT_PACK_FILENAME = "content.bin"
+# content packs kept memory mapped at once, the least recently read is unmapped first
+CONTENT_PACK_CACHE_SIZE = 64
+
+_XML_DECLARATION_RE = re.compile(r'<\?xml[^>]+\?>')
+_DOCUMENT_TAG_RE = re.compile(r'<html[^>]*>|</html>|<body[^>]*>|</body>')
+
+_KEEP_EMPTY_TAGS = frozenset(('img', 'br'))
+_PRESERVED_XPATH = etree.XPath('//pre | //code | //pre//* | //code//*')
+# reader stylesheet added to the head of every chapter
+_READER_STYLE = ' '.join("""
+    body { 
+        font-family: system-ui, -apple-system, sans-serif; 
+        line-height: 1.5; 
+        max-width: 100%;
+        padding: 0 1rem;
+        white-space: normal;
+    }
+    img { max-width: 100%; height: auto; }
+    p { margin: 0.75em 0; white-space: normal; }
+    h1, h2, h3, h4, h5, h6 { margin: 1em 0 0.5em 0; white-space: normal; }
+    pre, code { white-space: pre-wrap; }
+    * { white-space: normal; }
+""".split())
+
+# book index page, filled with the escaped metadata and one list item per chapter
+_INDEX_HEAD_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>%(title)s</title>
+    <style>
+        body {
+            font-family: system-ui, -apple-system, sans-serif;
+            line-height: 1.5;
+            max-width: 800px;
+            margin: 0 auto;
+            padding: 1rem;
+        }
+        .cover {
+            text-align: center;
+            margin-bottom: 2rem;
+        }
+        .cover img {
+            max-width: 300px;
+            height: auto;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+        }
+        .metadata {
+            margin-bottom: 2rem;
+        }
+        .toc {
+            margin-bottom: 2rem;
+        }
+        .toc ol {
+            list-style-type: decimal;
+            padding-left: 1.5rem;
+        }
+        .toc li {
+            padding: 0.25rem 0;
+        }
+    </style>
+</head>
+<body>
+    <div class="cover">%(cover)s</div>
+    <div class="metadata">
+        <h1>%(title)s</h1>
+        <p>Author: %(author)s</p>
+        %(details)s
+    </div>
+    <div class="toc">
+        <h2>Table of Contents</h2>
+        <ol>
+"""
+_INDEX_DETAIL_TEMPLATES = (
+    ('published_year', '<p>Published: %s</p>'),
+    ('publisher', '<p>Publisher: %s</p>'),
+    ('description', '<p>%s</p>')
+)
+# chapters are packed into one file, there is no per chapter file to link to
+_INDEX_CHAPTER_TEMPLATE = '            <li>%s</li>\n'
+_INDEX_TAIL = """        </ol>
+    </div>
+</body>
+</html>
+"""
+
+def _has_text(text: str | None) -> bool:
+    """Whether a text or tail holds anything besides whitespace"""
+    return bool(text) and not text.isspace()
+
+@functools.lru_cache(maxsize=32)
+def _chapter_text(html_content: str) -> str:
+    """Plain text of a chapter, cached so paging through one chapter parses its html once"""
+    return text_extraction_util.extract_text_streamed(html_content, False)
+
+# pack path -> (modification time, memory map), shared by every chapter read
+_content_packs: "OrderedDict[str, tuple]" = OrderedDict()
+_content_packs_lock = threading.Lock()
+
+def _content_pack(pack_path: str) -> mmap.mmap | bytes:
+    """Memory map of a content pack, mapped once and remapped when the file changes"""
+    mtime = os.path.getmtime(pack_path)
+    with _content_packs_lock:
+        cached = _content_packs.get(pack_path)
+        if cached is not None and cached[0] == mtime:
+            _content_packs.move_to_end(pack_path)
+            return cached[1]
+
+        with open(pack_path, "rb") as f:
+            # an empty file cannot be mapped
+            pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        _content_packs[pack_path] = (mtime, pack)
+        if cached is not None and isinstance(cached[1], mmap.mmap): cached[1].close()
+        while len(_content_packs) > CONTENT_PACK_CACHE_SIZE:
+            _, (_, evicted) = _content_packs.popitem(last=False)
+            if isinstance(evicted, mmap.mmap): evicted.close()
+        return pack
+
+def release_content_pack(content_dir: str) -> None:
+    """Unmap a book's content pack, before its content directory is deleted"""
+    with _content_packs_lock:
+        cached = _content_packs.pop(os.path.join(content_dir, CONTENT_PACK_FILENAME), None)
+    if cached is not None and isinstance(cached[1], mmap.mmap): cached[1].close()
+
+def read_chapter_bytes(content_path: str, content_offset: Optional[int] = None, content_size: Optional[int] = None) -> bytes:
+    """
+    Read a chapter's html as stored
+    Args:
+        content_path: The book's content pack, or for books stored before the pack the chapter's own file
+        content_offset: Byte offset of the chapter within the pack, None for a chapter file
+        content_size: Byte length of the chapter within the pack
+    Returns:
+        Chapter html encoded as utf-8
+    """
+    if content_offset is None:
+        with open(content_path, "rb") as f: return f.read()
+    return _content_pack(content_path)[content_offset:content_offset + content_size]
+
+def read_chapter_content(content_path: str, content_offset: Optional[int] = None, content_size: Optional[int] = None) -> str:
+    """Read a chapter's html, see read_chapter_bytes"""
+    return read_chapter_bytes(content_path, content_offset, content_size).decode("utf-8")
+
 class ContentService:
     """Service for managing and processing extracted book content"""
 
     def __init__(self):
         self.content_dir = settings.CONTENT_DIR
-        os.makedirs(self.content_dir, exist_ok=True)
         logger.info(f"Content service initialised with content directory: {self.content_dir}")
 
-    def process_html_content(self, html_content: str) -> str:
+    @staticmethod
+    def process_html_content(html_content: str) -> str:
         """
-        Process HTML content
+        Process HTML content, stateless so it can run in a worker process
         Args:
             html_content: Raw HTML content from EPUB
         Returns:
             Processed HTML content
         """
         try:
-            html_content = re.sub(r'<\?xml[^>]+\?>', '', html_content)
-            html_content = re.sub(r'[\s\n\r\t]+', ' ', html_content)
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-            for tag in soup(['script', 'style']): tag.decompose()
-
-            for comment in soup.find_all(text=lambda text: isinstance(text, Comment)): comment.extract()
-
-            if soup.html:
-                html_contents = list(soup.html.children)
-                soup.html.replace_with(*html_contents)
-
-            if soup.body:
-                body_contents = list(soup.body.children)
-                soup.body.replace_with(*body_contents)
-
-            # empty tags whitespace
-            for tag in soup.find_all():
-                if tag.name not in ['img', 'br'] and not tag.get_text(strip=True) and not tag.find_all(['img']):
-                    tag.decompose()
-
-            # links
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if href.startswith('#') or '.html' in href or '.xhtml' in href: link['data-internal-link'] = 'true'
-
-            # images
-            for img in soup.find_all('img', src=True):
-                img['data-epub-src'] = img['src']
-                img_src = img['src']
-                if '/' in img_src:
-                    img['src'] = os.path.basename(img_src)
-
-            # inline styles
-            for tag in soup.find_all(style=True): del tag['style']
-
-            style_tag = soup.new_tag('style')
-            style_tag.string = """
-                body { 
-                    font-family: system-ui, -apple-system, sans-serif; 
-                    line-height: 1.5; 
-                    max-width: 100%;
-                    padding: 0 1rem;
-                    white-space: normal;
-                }
-                img { max-width: 100%; height: auto; }
-                p { margin: 0.75em 0; white-space: normal; }
-                h1, h2, h3, h4, h5, h6 { margin: 1em 0 0.5em 0; white-space: normal; }
-                pre, code { white-space: pre-wrap; }
-                * { white-space: normal; }
-            """
-
-            if not soup.head:
-                head_tag = soup.new_tag('head')
-                if soup.html: soup.html.insert(0, head_tag)
-                else: soup.insert(0, head_tag)
-
-            if not soup.body:
-                body_tag = soup.new_tag('body')
-                if soup.html:
-                    for content in list(soup.html.contents):
-                        if content.name != 'head': body_tag.append(content)
-                    soup.html.append(body_tag)
-
-            soup.head.append(style_tag)
-
-            for text in soup.find_all(text=True):
-                if text.parent.name not in ['pre', 'code']:
-                    new_text = re.sub(r'\s+', ' ', text.string.strip())
-                    text.replace_with(new_text)
-
-            if soup.body: return ''.join(str(c) for c in soup.body.contents)
-            else: return str(soup)
+            html_content = _XML_DECLARATION_RE.sub('', html_content)
+            # whitespace runs collapsed with str.split, a plain c loop rather than a regex scan
+            html_content = ' '.join(html_content.split())
+            root = lxml.html.document_fromstring(html_content)
+
+            # the chapter's own head is dropped, the reader stylesheet becomes its only head content
+            etree.strip_elements(root, 'head', 'script', 'style', etree.Comment, with_tail=False)
+
+            # one bottom-up walk, an element is seen after all of its children so emptiness is known without rescanning
+            filled = set()
+            empty_tags = []
+            # whole pre and code subtrees keep their whitespace, found up front in one xpath call
+            preserved = set(_PRESERVED_XPATH(root))
+            for _, tag in etree.iterwalk(root, events=('end',)):
+                if tag not in preserved:
+                    if tag.text: tag.text = ' '.join(tag.text.split())
+                    for child in tag:
+                        if child.tail: child.tail = ' '.join(child.tail.split())
+
+                if tag.tag == 'img' or _has_text(tag.text) or any(child in filled or _has_text(child.tail) for child in tag):
+                    filled.add(tag)
+                elif tag.tag not in _KEEP_EMPTY_TAGS and tag.tag not in ('html', 'body'): empty_tags.append(tag)
+
+                # links
+                if tag.tag == 'a':
+                    href = tag.get('href')
+                    if href is not None and (href.startswith('#') or '.html' in href or '.xhtml' in href):
+                        tag.set('data-internal-link', 'true')
+
+                # images
+                elif tag.tag == 'img':
+                    img_src = tag.get('src')
+                    if img_src is not None:
+                        tag.set('data-epub-src', img_src)
+                        if '/' in img_src: tag.set('src', os.path.basename(img_src))
+
+                # inline styles
+                if 'style' in tag.attrib: del tag.attrib['style']
+
+            # empty tags whitespace, dropped with their tail text kept in place
+            for tag in empty_tags: tag.drop_tree()
+
+            head = root.find('head')
+            if head is None:
+                head = etree.Element('head')
+                root.insert(0, head)
+            etree.SubElement(head, 'style').text = _READER_STYLE
+
+            processed_html = etree.tostring(head, encoding='unicode', method='html', with_tail=False)
+            body = root.find('body')
+            if body is None: return processed_html
+
+            return processed_html + (body.text or '') + ''.join(
+                etree.tostring(child, encoding='unicode', method='html') for child in body
+            )
 
         except Exception as e:
             logger.warning(f"Error processing HTML content: {str(e)}")
-            html_content = re.sub(r'[\s\n\r\t]+', ' ', html_content)
-            html_content = re.sub(r'<html[^>]*>|</html>|<body[^>]*>|</body>', '', html_content)
+            html_content = ' '.join(html_content.split())
+            html_content = _DOCUMENT_TAG_RE.sub('', html_content)
             return html_content
 
     def create_index_file(self, content_dir: str, metadata: Dict[str, Any], chapters: List[Dict[str, Any]]) -> str | None:
@@ -122,65 +255,23 @@ class ContentService:
         try:
             index_path = os.path.join(content_dir, "index.html")
 
-            html_content = f"""<!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <title>{metadata.get('title', 'Unknown')}</title>
-                <style>
-                    body {{
-                        font-family: system-ui, -apple-system, sans-serif;
-                        line-height: 1.5;
-                        max-width: 800px;
-                        margin: 0 auto;
-                        padding: 1rem;
-                    }}
-                    .cover {{
-                        text-align: center;
-                        margin-bottom: 2rem;
-                    }}
-                    .cover img {{
-                        max-width: 300px;
-                        height: auto;
-                        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-                    }}
-                    .metadata {{
-                        margin-bottom: 2rem;
-                    }}
-                    .toc {{
-                        margin-bottom: 2rem;
-                    }}
-                    .toc ol {{
-                        list-style-type: decimal;
-                        padding-left: 1.5rem;
-                    }}
-                    .toc li {{
-                        padding: 0.25rem 0;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="cover">
-                    {f'<img src="../../../{metadata["cover_path"]}" alt="Cover">' if metadata.get('cover_path') else ''}
-                </div>
-                <div class="metadata">
-                    <h1>{metadata.get('title', 'Unknown')}</h1>
-                    <p>Author: {metadata.get('author', 'Unknown')}</p>
-                    {f'<p>Published: {metadata.get("published_year", "")}</p>' if metadata.get('published_year') else ''}
-                    {f'<p>Publisher: {metadata.get("publisher", "")}</p>' if metadata.get('publisher') else ''}
-                    {f'<p>{metadata.get("description", "")}</p>' if metadata.get('description') else ''}
-                </div>
-                <div class="toc">
-                    <h2>Table of Contents</h2>
-                    <ol>
-                        {"".join([f'<li><a href="{os.path.basename(ch["content_path"])}">{ch["title"]}</a></li>' for ch in chapters])}
-                    </ol>
-                </div>
-            </body>
-            </html>
-            """
-
-            with open(index_path, "w", encoding="utf-8") as f: f.write(html_content)
+            # every metadata value and chapter title is escaped, they come straight from the uploaded epub
+            fields = {
+                'title': html.escape(str(metadata.get('title', 'Unknown'))),
+                'author': html.escape(str(metadata.get('author', 'Unknown'))),
+                'cover': f'<img src="../../../{html.escape(metadata["cover_path"])}" alt="Cover">' if metadata.get('cover_path') else '',
+                'details': ''.join(
+                    template % html.escape(str(metadata[key])) for key, template in _INDEX_DETAIL_TEMPLATES if metadata.get(key)
+                )
+            }
+
+            buffer = io.StringIO()
+            buffer.write(_INDEX_HEAD_TEMPLATE % fields)
+            for chapter in chapters:
+                buffer.write(_INDEX_CHAPTER_TEMPLATE % html.escape(str(chapter["title"])))
+            buffer.write(_INDEX_TAIL)
+
+            with open(index_path, "w", encoding="utf-8") as f: f.write(buffer.getvalue())
 
             return index_path
 
@@ -205,7 +296,7 @@ class ContentService:
                 "chapters": chapters
             }
 
-            with open(metadata_path, "w", encoding="utf-8") as f: json.dump(metadata_obj, f, indent=2)
+            with open(metadata_path, "wb") as f: f.write(orjson.dumps(metadata_obj, option=orjson.OPT_INDENT_2))
 
             return metadata_path
 
@@ -224,7 +315,7 @@ class ContentService:
             Text at the specified location with context
         """
         try:
-            text = text_extraction_util.extract_text_streamed(html_content, False)
+            text = _chapter_text(html_content)
             char_position = min(len(text) - 1, location * settings.LOCATION_CHUNK_SIZE)
             if char_position < 0: return ""
 
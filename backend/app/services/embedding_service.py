@@ -3,30 +3,59 @@ MeReader Embedding Service for generating and managing text embeddings
 """
 import asyncio
 import logging
+import multiprocessing
 import uuid
 import time
 import os
-import gc
 import pickle
 import json
-import nltk
-from nltk.tokenize import word_tokenize
-from rank_bm25 import BM25Okapi
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
-from app.db.qdrant import qdrant_manager
+from app.db.qdrant import qdrant_manager, UPSERT_BATCH_SIZE
 from app.core.config import settings
 from app.core.exceptions import VectorStoreException
 from app.services.ollama_service import ollama_service
-from app.db.sqlite import get_current_session, SessionLocal
+from app.db.sqlite import engine, SessionLocalRO
 from app.services.location_service import location_service
+from app.services.bm25_index import build_index
 from app.services.text_extraction_utility import text_extraction_util
+from app.services.content_service import read_chapter_content
 from app.db.models import Book, Chapter
 
 logger = logging.getLogger(__name__)
 
+# batches waiting between two ingestion stages, bounds the memory held while a stage falls behind
+_PIPELINE_QUEUE_SIZE = 4
+# location summaries generated at once while a book is ingested
+_SUMMARY_CONCURRENCY = 2
+
+# bm25 indexes are tokenized and built in worker processes, the build holds the gil for the length of the book
+# spawned rather than forked, the workers only import the numpy index module
+_BM25_BUILD_EXECUTOR = ProcessPoolExecutor(
+    max_workers=os.cpu_count() or 1,
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+def _set_has_vectors(book_id: str, has_vectors: bool) -> None:
+    """
+    Record on the book row whether its vectors are all stored
+    One short transaction on the writer connection, callers must not be holding it
+    """
+    try:
+        with engine.begin() as connection:
+            connection.execute(update(Book).where(Book.id == book_id).values(has_vectors=has_vectors))
+    except Exception as e:
+        logger.warning(f"Failed to record vector status for book {book_id}: {str(e)}")
+
+def _summary_point_id(book_id: str, location: int) -> str:
+    """Point id of the summary at a location, the same on every run"""
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{book_id}_sum_{location}"))
+
 class EmbeddingService:
     """Service for generating and managing text embeddings"""
 
@@ -34,6 +63,27 @@ class EmbeddingService:
         logger.info("Embedding service initialised")
         pass
 
+    @staticmethod
+    def _load_book_rows(book_id: str, db_session: Session = None) -> Tuple[Optional[Book], List[Chapter]]:
+        """
+        Read a book and its chapters, a session opened here is closed before they are returned
+        Args:
+            book_id: ID of the book
+            db_session: database session, a read-only one is opened when not given
+        Returns:
+            The book, None if it does not exist, and its chapters in order
+        """
+        close_session = db_session is None
+        if close_session: db_session = SessionLocalRO()
+        try:
+            book = db_session.get(Book, book_id)
+            if not book: return None, []
+            chapters = db_session.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).all()
+            return book, chapters
+        finally:
+            # loaded column values stay readable on the detached rows
+            if close_session: db_session.close()
+
     async def embed_book_content(self, book_id: str, db_session: Session = None) -> int:
         """
         Process and embed book content from chapter files
@@ -44,43 +94,62 @@ class EmbeddingService:
             Number of chunks embedded
         """
         try:
-            if qdrant_manager.has_vectors_for_book(book_id):
+            # rows are read up front, no session is held while the book is embedded
+            book, chapters = self._load_book_rows(book_id, db_session)
+            if not book: raise VectorStoreException(f"Book with id {book_id} not found")
+
+            # the flag is only set once a whole book is embedded, rows from before it existed ask qdrant
+            has_vectors = book.has_vectors
+            if has_vectors is None:
+                has_vectors = await asyncio.to_thread(qdrant_manager.has_vectors_for_book, book_id, True)
+                if has_vectors: await asyncio.to_thread(_set_has_vectors, book_id, True)
+            if has_vectors:
                 logger.info(f"Embeddings already exist for book {book_id}, skipping embedding.")
                 return 0
 
             logger.info(f"Starting optimized embedding process for book {book_id}")
 
-            close_session = False
-            if db_session is None:
-                try: db_session = get_current_session()
-                except Exception:
-                    db_session = SessionLocal()
-                    close_session = True
+            content_dir = book.content_path
+            if not content_dir: raise VectorStoreException(f"Content directory not found for book {book_id}")
 
-            try:
-                book = db_session.query(Book).filter(Book.id == book_id).first()
-                if not book: raise VectorStoreException(f"Book with id {book_id} not found")
+            if not chapters: raise VectorStoreException(f"No chapters found for book {book_id}")
+
+            chunk_size = settings.CHUNK_SIZE
+            chunk_overlap = settings.CHUNK_OVERLAP
+            max_batch_size = 120
+            summary_interval = 11
+
+            start_time = time.time()
 
-                content_dir = book.content_path
-                if not content_dir: raise VectorStoreException(f"Content directory not found for book {book_id}")
+            # BM25 indexing
+            all_chunks = []
+            all_metadata = []
 
-                chapters = db_session.query(Chapter).filter(Chapter.book_id == book_id).order_by(Chapter.order).all()
-                if not chapters: raise VectorStoreException(f"No chapters found for book {book_id}")
+            # point ids are derived from the chunk position and summary location, an ingest that stopped part way
+            # is resumed: batches and summaries whose points are stored already are not generated again
+            stored_ids = await asyncio.to_thread(qdrant_manager.get_book_point_ids, book_id)
+            if stored_ids: logger.info(f"Resuming embedding for book {book_id}, {len(stored_ids)} points stored")
 
-                chunk_size = settings.CHUNK_SIZE
-                chunk_overlap = settings.CHUNK_OVERLAP
-                max_batch_size = 120
-                summary_interval = 11
+            # location summaries run detached from the pipeline, a few llm requests at a time
+            summary_semaphore = asyncio.Semaphore(_SUMMARY_CONCURRENCY)
+            pending_summaries: List[asyncio.Task] = []
 
-                total_embedded = 0
-                start_time = time.time()
+            async def summarise(*args) -> None:
+                async with summary_semaphore: await self._create_location_summary(*args)
 
-                # BM25 indexing
-                all_chunks = []
-                all_metadata = []
+            # chunking, embedding and upserting run as three stages joined by bounded queues,
+            # the next batches are chunked and upserted while ollama embeds the current one
+            batch_queue = asyncio.Queue(maxsize=_PIPELINE_QUEUE_SIZE)
+            vector_queue = asyncio.Queue(maxsize=_PIPELINE_QUEUE_SIZE)
+            total_embedded = 0
 
+            # chapters and batches skipped after an error, the book is only marked embedded when there are none
+            failures = {"chapters": 0, "batches": 0}
+
+            async def produce_batches() -> None:
+                """Chunk every chapter and queue its batches of chunk texts with their metadata and point ids"""
+                chunk_index = 0
                 # location for summaries
-                current_location = 1
                 location_text_buffer = ""
                 last_summary_location = 0
 
@@ -90,7 +159,7 @@ class EmbeddingService:
                         continue
 
                     try:
-                        file_size = os.path.getsize(chapter.content_path)
+                        file_size = chapter.content_size if chapter.content_offset is not None else os.path.getsize(chapter.content_path)
                         if file_size < 50:
                             logger.info(f"Skipping empty/small chapter: {chapter.title} (size: {file_size} bytes)")
                             continue
@@ -98,15 +167,19 @@ class EmbeddingService:
                         logger.info(
                             f"Processing chapter: {chapter.title} (id: {chapter.id}, order: {chapter.order}, size: {file_size / 1024:.1f}kb)")
 
-                        chunk_generator = text_extraction_util.chunk_text_streamed(
-                            chapter.content_path,
-                            chunk_size=int(chunk_size),
-                            chunk_overlap=chunk_overlap,
-                            min_chunk_size=100
+                        # html parsing and chunking is cpu bound, keep it off the event loop
+                        chapter_chunks = await asyncio.to_thread(
+                            lambda: list(text_extraction_util.chunk_html_content(
+                                read_chapter_content(chapter.content_path, chapter.content_offset, chapter.content_size),
+                                chunk_size=int(chunk_size),
+                                chunk_overlap=chunk_overlap,
+                                min_chunk_size=100
+                            ))
                         )
                         chunks_processed = 0
 
-                        for batch in text_extraction_util.batch_chunks(chunk_generator, max_batch_size):
+                        for batch_start in range(0, len(chapter_chunks), max_batch_size):
+                            batch = chapter_chunks[batch_start:batch_start + max_batch_size]
                             chunks_processed += len(batch)
                             if chunks_processed % 50 == 0:
                                 logger.info(f"Processed {chunks_processed} chunks from chapter {chapter.title}")
@@ -123,13 +196,14 @@ class EmbeddingService:
                                 location_text_buffer += chunk_text + " "
 
                                 if (location - last_summary_location) >= summary_interval:
-                                    await self._create_location_summary(
-                                        book_id,
-                                        location,
-                                        location_text_buffer,
-                                        chapter.title,
-                                        book.total_locations or 100
-                                    )
+                                    if _summary_point_id(book_id, location) not in stored_ids:
+                                        pending_summaries.append(asyncio.create_task(summarise(
+                                            book_id,
+                                            location,
+                                            location_text_buffer,
+                                            chapter.title,
+                                            book.total_locations or 100
+                                        )))
                                     last_summary_location = location
                                     location_text_buffer = ""
 
@@ -148,88 +222,142 @@ class EmbeddingService:
                                 all_chunks.append(chunk_text)
                                 all_metadata.append(metadata)
 
-                            embeddings = await ollama_service.generate_embeddings_batch(batch)
-                            vector_ids = [str(uuid.uuid4()) for _ in range(len(batch))]
-                            qdrant_manager.add_text_vectors(embeddings, batch_metadata, vector_ids)
+                            batch_ids = [
+                                str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{book_id}:{chapter.id}:{chunk_index + i}"))
+                                for i in range(len(batch))
+                            ]
+                            chunk_index += len(batch)
+                            await batch_queue.put((chapter.title, batch, batch_metadata, batch_ids))
 
-                            total_embedded += len(batch)
+                    except Exception as e:
+                        logger.error(f"Error processing chapter {chapter.title}: {str(e)}")
+                        failures["chapters"] += 1
+                        continue
 
-                            if total_embedded % 20 == 0:
-                                elapsed = time.time() - start_time
-                                avg_time_per_chunk = elapsed / total_embedded if total_embedded else 0
-                                eta_minutes = int((avg_time_per_chunk * (len(chapters) * 10 - total_embedded)) / 60)
+                await batch_queue.put(None)
 
-                                logger.info(
-                                    f"Embedded {total_embedded} chunks, "
-                                    f"current chapter: {chapter.title} | "
-                                    f"avg: {avg_time_per_chunk:.2f}s per chunk | "
-                                    f"eta: ~{eta_minutes} min"
-                                )
+            async def embed_batches() -> None:
+                """Embed each queued batch and pass its points on to the upsert stage"""
+                nonlocal total_embedded
 
-                            gc.collect()
+                while (item := await batch_queue.get()) is not None:
+                    chapter_title, batch, batch_metadata, batch_ids = item
+                    if stored_ids.issuperset(batch_ids): continue
 
+                    try:
+                        embeddings = await ollama_service.generate_embeddings_batch(batch)
                     except Exception as e:
-                        logger.error(f"Error processing chapter {chapter.title}: {str(e)}")
+                        logger.error(f"Error embedding batch from chapter {chapter_title}: {str(e)}")
+                        failures["batches"] += 1
                         continue
 
-                # BM25 index
-                if all_chunks:
-                    logger.info(f"Creating BM25 index for book {book_id} with {len(all_chunks)} chunks")
-                    try:
-                        self._create_bm25_index(book_id, all_chunks)
+                    await vector_queue.put((embeddings, batch_metadata, batch_ids))
+                    total_embedded += len(batch)
 
-                        # metadata mapping for BM25
-                        metadata_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_metadata.json")
-                        with open(metadata_path, 'w') as f: json.dump(all_metadata, f)
+                    if total_embedded % 20 == 0:
+                        elapsed = time.time() - start_time
+                        avg_time_per_chunk = elapsed / total_embedded if total_embedded else 0
+                        eta_minutes = int((avg_time_per_chunk * (len(chapters) * 10 - total_embedded)) / 60)
 
-                        logger.info(f"Created BM25 index and metadata for book {book_id}")
-                    except Exception as e:
-                        logger.error(f"Failed to create BM25 index: {str(e)}")
+                        logger.info(
+                            f"Embedded {total_embedded} chunks, "
+                            f"current chapter: {chapter_title} | "
+                            f"avg: {avg_time_per_chunk:.2f}s per chunk | "
+                            f"eta: ~{eta_minutes} min"
+                        )
 
-                logger.info(f"Completed embedding for book {book_id}, total chunks: {total_embedded}")
+                await vector_queue.put(None)
+
+            async def upsert_vectors() -> None:
+                """Buffer embedded points across batches and send them to qdrant in full upserts"""
+                pending_vectors, pending_metadata, pending_ids = [], [], []
+
+                while (item := await vector_queue.get()) is not None:
+                    embeddings, batch_metadata, batch_ids = item
+                    pending_vectors.extend(embeddings)
+                    pending_metadata.extend(batch_metadata)
+                    pending_ids.extend(batch_ids)
+                    if len(pending_vectors) >= UPSERT_BATCH_SIZE:
+                        await asyncio.to_thread(
+                            qdrant_manager.add_text_vectors, pending_vectors, pending_metadata, pending_ids
+                        )
+                        pending_vectors, pending_metadata, pending_ids = [], [], []
+
+                if pending_vectors:
+                    await asyncio.to_thread(qdrant_manager.add_text_vectors, pending_vectors, pending_metadata, pending_ids)
+
+            # a failed stage cancels the others, none is left waiting on a queue nobody serves
+            stages = [asyncio.create_task(stage()) for stage in (produce_batches, embed_batches, upsert_vectors)]
+            try:
+                await asyncio.gather(*stages)
+                await asyncio.gather(*pending_summaries, return_exceptions=True)
+            except BaseException:
+                for task in stages + pending_summaries: task.cancel()
+                raise
+
+            # BM25 index
+            if all_chunks:
+                logger.info(f"Creating BM25 index for book {book_id} with {len(all_chunks)} chunks")
+                try:
+                    await self._create_bm25_index(book_id, all_chunks, all_metadata)
+                    logger.info(f"Created BM25 index and metadata for book {book_id}")
+                except Exception as e:
+                    logger.error(f"Failed to create BM25 index: {str(e)}")
+
+            if failures["chapters"] or failures["batches"]:
+                # marked incomplete rather than left unset, an unset flag would be answered from the points stored so far
+                await asyncio.to_thread(_set_has_vectors, book_id, False)
+                logger.warning(
+                    f"Embedding for book {book_id} incomplete, {failures['chapters']} chapters and "
+                    f"{failures['batches']} batches failed, the next run resumes from the stored points"
+                )
                 return total_embedded
 
-            finally:
-                if close_session and db_session: db_session.close()
+            await asyncio.to_thread(_set_has_vectors, book_id, True)
+            logger.info(f"Completed embedding for book {book_id}, total chunks: {total_embedded}")
+            return total_embedded
 
         except Exception as e:
             logger.error(f"Failed to embed book content: {str(e)}", exc_info=True)
-            try:
-                qdrant_manager.delete_book_vectors(book_id)
-                bm25_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_bm25.pkl")
-                metadata_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_metadata.json")
-                os.remove(bm25_path)
-                os.remove(metadata_path)
-
+            # stored points are kept, the next run for the book resumes from them
+            try: shutil.rmtree(settings.bm25_index_dir(book_id))
             except Exception: pass
 
             raise VectorStoreException(f"Failed to embed book content: {str(e)}")
 
-    async def delete_book_embeddings(self, book_id: str) -> bool:
+    async def delete_book_embeddings(self, book_id: str, reset_flag: bool = True) -> bool:
         """
         Delete all embeddings for a book
         Args:
             book_id: ID of the book
+            reset_flag: Clear has_vectors on the book row, not needed when the row itself was deleted
         Returns:
             True if deletion was successful
         """
         try:
-            result = qdrant_manager.delete_book_vectors(book_id)
-            bm25_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_bm25.pkl")
-            metadata_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_metadata.json")
+            # the qdrant client, the flag update and the file removal all block, none of it runs on the event loop
+            return await asyncio.to_thread(self._delete_book_embeddings, book_id, reset_flag)
+        except Exception as e:
+            logger.error(f"Failed to delete book embeddings: {str(e)}")
+            raise VectorStoreException(f"Failed to delete book embeddings: {str(e)}")
 
-            os.remove(bm25_path)
-            logger.info(f"Deleted BM25 index for book {book_id}")
+    @staticmethod
+    def _delete_book_embeddings(book_id: str, reset_flag: bool) -> bool:
+        """Delete a book's vectors and BM25 index, see delete_book_embeddings"""
+        result = qdrant_manager.delete_book_vectors(book_id)
+        if reset_flag: _set_has_vectors(book_id, False)
+
+        for legacy_path in (settings.bm25_index_file(book_id), settings.bm25_metadata_file(book_id)):
+            if os.path.exists(legacy_path): os.remove(legacy_path)
 
-            os.remove(metadata_path)
-            logger.info(f"Deleted BM25 metadata for book {book_id}")
+        index_dir = settings.bm25_index_dir(book_id)
+        if os.path.isdir(index_dir):
+            shutil.rmtree(index_dir)
+            logger.info(f"Deleted BM25 index for book {book_id}")
 
-            logger.info(f"Deleted embeddings for book {book_id}")
+        logger.info(f"Deleted embeddings for book {book_id}")
 
-            return result
-        except Exception as e:
-            logger.error(f"Failed to delete book embeddings: {str(e)}")
-            raise VectorStoreException(f"Failed to delete book embeddings: {str(e)}")
+        return result
 
     async def embed_single_text(self, text: str) -> List[float]:
         """
@@ -284,49 +412,64 @@ class EmbeddingService:
                 'content_type': 'summary'
             }
 
-            summary_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{book_id}_sum_{location}"))
-            qdrant_manager.add_text_vectors([summary_embedding], [summary_metadata], [summary_id])
+            await asyncio.to_thread(
+                qdrant_manager.add_text_vectors, [summary_embedding], [summary_metadata], [_summary_point_id(book_id, location)]
+            )
             logger.info(f"created summary for location {location}")
 
         except Exception as e: logger.error(f"failed to create location summary: {str(e)}")
 
-    def _create_bm25_index(self, book_id: str, text_chunks: List[str]) -> None:
-        """Create and save a BM25 index"""
+    async def _create_bm25_index(self, book_id: str, text_chunks: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """Create and save a BM25 index with the chunk metadata aligned to it"""
         try:
-            try: nltk.data.find('tokenizers/punkt')
-            except LookupError: nltk.download('punkt', quiet=True)
-
-            tokenized_chunks = [word_tokenize(chunk.lower()) for chunk in text_chunks]
-            bm25_index = BM25Okapi(tokenized_chunks)
-
-            cache_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_bm25.pkl")
-            with open(cache_path, 'wb') as f:
-                pickle.dump({
-                    'index': bm25_index,
-                    'chunks': text_chunks,
-                    'tokenized_chunks': tokenized_chunks
-                }, f)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                _BM25_BUILD_EXECUTOR, build_index, str(settings.bm25_index_dir(book_id)), text_chunks, metadata
+            )
 
             logger.info(f"Created and saved BM25 index for book {book_id} with {len(text_chunks)} chunks")
         except Exception as e:
             logger.error(f"Failed to create BM25 index for book {book_id}: {str(e)}")
 
-    def load_bm25_index(self, book_id: str) -> Dict[str, Any]:
-        """BM25 index"""
+    def locate_bm25_index(self, book_id: str) -> Optional[str]:
+        """
+        Directory of a book's BM25 index, converting a legacy pickled index on first use
+        Args:
+            book_id: ID of the book
+        Returns:
+            The index directory, or None if the book has none
+        """
         try:
-            cache_path = os.path.join(settings.BM25_INDEX_CACHE_DIR, f"{book_id}_bm25.pkl")
-            if os.path.exists(cache_path):
-                with open(cache_path, 'rb') as f:
-                    index_data = pickle.load(f)
-                logger.info(f"Loaded BM25 index for book {book_id}")
-                return index_data
-            else:
+            index_dir = str(settings.bm25_index_dir(book_id))
+            if not os.path.isdir(index_dir) and not self._convert_legacy_bm25_index(book_id):
                 logger.warning(f"No BM25 index found for book {book_id}")
                 return None
+
+            return index_dir
         except Exception as e:
-            logger.error(f"Failed to load BM25 index for book {book_id}: {str(e)}")
+            logger.error(f"Failed to locate BM25 index for book {book_id}: {str(e)}")
             return None
 
-
+    def _convert_legacy_bm25_index(self, book_id: str) -> bool:
+        """
+        Rewrite a pickled BM25 index and its json metadata in the array format
+        Args:
+            book_id: ID of the book
+        Returns:
+            True if a legacy index was found and converted
+        """
+        pickle_path = settings.bm25_index_file(book_id)
+        metadata_path = settings.bm25_metadata_file(book_id)
+        if not os.path.exists(pickle_path) or not os.path.exists(metadata_path): return False
+
+        with open(pickle_path, 'rb') as f: index_data = pickle.load(f)
+        with open(metadata_path, 'r') as f: metadata = json.load(f)
+
+        # retokenized, the pickled tokens came from a different tokenizer than the one queries use
+        build_index(str(settings.bm25_index_dir(book_id)), index_data['chunks'], metadata)
+        os.remove(pickle_path)
+        os.remove(metadata_path)
+        logger.info(f"Converted legacy BM25 index for book {book_id}")
+        return True
 
 embedding_service = EmbeddingService()
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+MeReader EPUB Archive - Reads the package document of an EPUB and streams its entries from the zip on demand
+"""
+import posixpath
+import zipfile
+from typing import IO, Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+import lxml.html
+from lxml import etree
+
+# item types, same meaning as ebooklib's constants of the same name
+ITEM_UNKNOWN = 0
+ITEM_IMAGE = 1
+ITEM_NAVIGATION = 4
+ITEM_DOCUMENT = 9
+ITEM_COVER = 10
+
+NAMESPACES = {
+    "CONTAINER": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "OPF": "http://www.idpf.org/2007/opf",
+    "DC": "http://purl.org/dc/elements/1.1/",
+    "DAISY": "http://www.daisy.org/z3986/2005/ncx/"
+}
+CONTAINER_FILE = "META-INF/container.xml"
+DOCUMENT_MEDIA_TYPES = frozenset(("application/xhtml+xml", "text/html"))
+
+# entities are never resolved, package documents come from uploaded files
+_XML_PARSER = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+
+class TocLink(NamedTuple):
+    """Table of contents entry, a section with children is a (TocLink, [children]) tuple as in ebooklib"""
+    title: Optional[str]
+    href: str
+
+class EpubItem:
+    """Manifest item of an EPUB, its content is read from the archive only when asked for"""
+
+    __slots__ = ("archive", "id", "file_name", "media_type", "properties", "item_type")
+
+    def __init__(self, archive: "EpubArchive", item_id: Optional[str], file_name: str, media_type: Optional[str],
+                 properties: List[str], item_type: int):
+        self.archive = archive
+        self.id = item_id
+        self.file_name = file_name
+        self.media_type = media_type
+        self.properties = properties
+        self.item_type = item_type
+
+    def get_type(self) -> int:
+        return self.item_type
+
+    def get_content(self) -> bytes:
+        """Decompressed content of the item"""
+        return self.archive.read_file(self.file_name)
+
+    def open(self) -> IO[bytes]:
+        """Stream over the item's content, decompressed as it is read"""
+        return self.archive.open_file(self.file_name)
+
+class EpubArchive:
+    """
+    EPUB opened straight from its zip file, a lightweight replacement for ebooklib's read_epub.
+    Only the container, the package document and the table of contents are parsed up front,
+    the zip's central directory is read once and kept open until close
+    """
+
+    def __init__(self, file_path: str):
+        self.zip_file = zipfile.ZipFile(file_path, "r")
+        try:
+            self.metadata: Dict[str, List[Tuple[Optional[str], Dict[str, str]]]] = {}
+            self.items: List[EpubItem] = []
+            self.spine: List[Tuple[str, str]] = []
+            self.toc: List[Any] = []
+            self._items_by_id: Dict[str, EpubItem] = {}
+            self._items_by_href: Dict[str, EpubItem] = {}
+            self._load()
+        except Exception:
+            self.zip_file.close()
+            raise
+
+    def __enter__(self) -> "EpubArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.zip_file.close()
+
+    def read_file(self, name: str) -> bytes:
+        """
+        Read an entry relative to the package document
+        Args:
+            name: Path of the entry relative to the package document
+        Returns:
+            Decompressed content of the entry
+        """
+        return self.zip_file.read(posixpath.normpath(posixpath.join(self.opf_dir, name)))
+
+    def open_file(self, name: str) -> IO[bytes]:
+        """
+        Open an entry relative to the package document for streaming
+        Args:
+            name: Path of the entry relative to the package document
+        Returns:
+            Readable binary stream over the entry
+        """
+        return self.zip_file.open(posixpath.normpath(posixpath.join(self.opf_dir, name)))
+
+    def get_metadata(self, namespace: str, name: str) -> List[Tuple[Optional[str], Dict[str, str]]]:
+        """
+        Metadata values, as (value, attributes) pairs in document order
+        Args:
+            namespace: Namespace key, only 'DC' holds values
+            name: Element name, e.g. 'title'
+        Returns:
+            List of values
+        """
+        if namespace != "DC": return []
+        return self.metadata.get(name, [])
+
+    def get_items(self) -> List[EpubItem]:
+        return self.items
+
+    def get_items_of_type(self, item_type: int) -> List[EpubItem]:
+        return [item for item in self.items if item.item_type == item_type]
+
+    def get_item_with_id(self, item_id: str) -> Optional[EpubItem]:
+        return self._items_by_id.get(item_id)
+
+    def get_item_with_href(self, href: Any) -> Optional[EpubItem]:
+        # anything but a path, like the child list of a (section, children) toc entry, matches no item
+        return self._items_by_href.get(href) if isinstance(href, str) else None
+
+    def _load(self) -> None:
+        """Parse the container, the package document and the table of contents"""
+        container = etree.fromstring(self.zip_file.read(CONTAINER_FILE), _XML_PARSER)
+        opf_file = None
+        for root_file in container.iterfind(".//{%s}rootfile" % NAMESPACES["CONTAINER"]):
+            if root_file.get("media-type") == "application/oebps-package+xml":
+                opf_file = root_file.get("full-path")
+        if not opf_file: raise ValueError("EPUB container does not name a package document")
+
+        self.opf_dir = posixpath.dirname(opf_file)
+        package = etree.fromstring(self.zip_file.read(opf_file), _XML_PARSER)
+
+        # dublin core metadata
+        metadata = package.find("{%s}metadata" % NAMESPACES["OPF"])
+        if metadata is not None:
+            for element in metadata.iterfind("{%s}*" % NAMESPACES["DC"]):
+                name = etree.QName(element).localname
+                self.metadata.setdefault(name, []).append((element.text, dict(element.attrib)))
+
+        # manifest
+        manifest = package.find("{%s}manifest" % NAMESPACES["OPF"])
+        for entry in manifest.iterfind("{%s}item" % NAMESPACES["OPF"]) if manifest is not None else ():
+            href = entry.get("href")
+            if not href: continue
+            media_type = entry.get("media-type")
+            properties = entry.get("properties", "").split()
+
+            if media_type in DOCUMENT_MEDIA_TYPES:
+                item_type = ITEM_NAVIGATION if "nav" in properties else ITEM_DOCUMENT
+            elif media_type and media_type.startswith("image/"):
+                item_type = ITEM_COVER if "cover-image" in properties else ITEM_IMAGE
+            else: item_type = ITEM_UNKNOWN
+
+            item = EpubItem(self, entry.get("id"), unquote(href), media_type, properties, item_type)
+            self.items.append(item)
+            if item.id: self._items_by_id.setdefault(item.id, item)
+            self._items_by_href.setdefault(item.file_name, item)
+
+        # spine
+        spine = package.find("{%s}spine" % NAMESPACES["OPF"])
+        if spine is None: return
+        self.spine = [(itemref.get("idref"), itemref.get("linear", "yes"))
+                      for itemref in spine.iterfind("{%s}itemref" % NAMESPACES["OPF"])]
+
+        # table of contents, the epub 3 navigation document wins over an ncx
+        nav_item = next((item for item in self.items if item.item_type == ITEM_NAVIGATION), None)
+        if nav_item is not None: self.toc = self._parse_nav(nav_item)
+        elif spine.get("toc") and self.get_item_with_id(spine.get("toc")):
+            self.toc = self._parse_ncx(self.get_item_with_id(spine.get("toc")))
+
+    def _parse_nav(self, nav_item: EpubItem) -> List[Any]:
+        """
+        Table of contents from an EPUB 3 navigation document
+        Args:
+            nav_item: Navigation document item
+        Returns:
+            Table of contents, hrefs relative to the package document
+        """
+        document = lxml.html.document_fromstring(nav_item.get_content())
+        nav_nodes = document.xpath("//nav[@*='toc']")
+        if not nav_nodes: return []
+        base_path = posixpath.dirname(nav_item.file_name)
+
+        def parse_list(list_node) -> List[Any]:
+            entries = []
+            if list_node is None: return entries
+
+            for item_node in list_node.findall("li"):
+                sublist_node = item_node.find("ol")
+                link_node = item_node.find("a")
+                href = link_node.get("href") if link_node is not None else None
+                # percent encoded like manifest hrefs, decoded the same way so they look up the same items
+                if href: href = posixpath.normpath(posixpath.join(base_path, unquote(href)))
+
+                if sublist_node is not None:
+                    entries.append((TocLink(item_node[0].text_content(), href), parse_list(sublist_node)))
+                elif href: entries.append(TocLink(link_node.text_content(), href))
+
+            return entries
+
+        return parse_list(nav_nodes[0].find("ol"))
+
+    def _parse_ncx(self, ncx_item: EpubItem) -> List[Any]:
+        """
+        Table of contents from an EPUB 2 NCX file
+        Args:
+            ncx_item: NCX item
+        Returns:
+            Table of contents, hrefs relative to the package document
+        """
+        ncx = etree.fromstring(ncx_item.get_content(), _XML_PARSER)
+        nav_map = ncx.find("{%s}navMap" % NAMESPACES["DAISY"])
+        if nav_map is None: return []
+        base_path = posixpath.dirname(ncx_item.file_name)
+
+        def parse_points(parent) -> List[Any]:
+            entries = []
+            for nav_point in parent.iterfind("{%s}navPoint" % NAMESPACES["DAISY"]):
+                label = nav_point.findtext("{%s}navLabel/{%s}text" % (NAMESPACES["DAISY"], NAMESPACES["DAISY"]))
+                content = nav_point.find("{%s}content" % NAMESPACES["DAISY"])
+                href = content.get("src", "") if content is not None else ""
+                if href: href = posixpath.normpath(posixpath.join(base_path, unquote(href)))
+                children = parse_points(nav_point)
+
+                entries.append((TocLink(label, href), children) if children else TocLink(label, href))
+            return entries
+
+        return parse_points(nav_map)
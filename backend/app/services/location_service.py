@@ -64,7 +64,7 @@ class LocationService:
             Text at the specified location
         """
         try:
-            text = text_extraction_util.extract_text_streamed(content)
+            text = text_extraction_util.extract_text_streamed(content, False)
             # character position from location
             char_position = min(len(text) - 1, (location - 1) * self.location_chunk_size)
             if char_position < 0: return ""
@@ -19,8 +19,28 @@ class OllamaService:
         self.llm_model = settings.OLLAMA_LLM_MODEL
         self.embedding_model = settings.OLLAMA_EMBEDDING_MODEL
         self.timeout = 60.0
+        # one pooled client for every request, connections are kept alive between calls
+        self._client: Optional[httpx.AsyncClient] = None
+        # cleared when the server has no batched /api/embed endpoint, older ollama versions
+        self.batch_embed_supported = True
         logger.info(f"LLM: {self.llm_model}, EM: {self.embedding_model}")
 
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Shared http client, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the shared http client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
     async def _make_request(
             self,
             endpoint: str,
@@ -38,23 +58,21 @@ class OllamaService:
         Returns:
             Response object or parsed JSON data
         """
-        url = f"{self.base_url}{endpoint}"
-
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                if method.upper() == "POST":
-                    if stream: return await client.post(url, json=data, timeout=self.timeout)
-                    else: response = await client.post(url, json=data, timeout=self.timeout)
-                else:
-                    if stream: return await client.get(url, params=data, timeout=self.timeout)
-                    else: response = await client.get(url, params=data,timeout=self.timeout)
+            client = await self._get_client()
+            if method.upper() == "POST":
+                if stream: return await client.post(endpoint, json=data)
+                else: response = await client.post(endpoint, json=data)
+            else:
+                if stream: return await client.get(endpoint, params=data)
+                else: response = await client.get(endpoint, params=data)
 
-                if response.status_code != 200:
-                    error_msg = f"Ollama API error: {response.status_code} - {response.text}"
-                    logger.error(error_msg)
-                    raise OllamaServiceException(error_msg)
+            if response.status_code != 200:
+                error_msg = f"Ollama API error: {response.status_code} - {response.text}"
+                logger.error(error_msg)
+                raise OllamaServiceException(error_msg, ollama_status_code=response.status_code)
 
-                return response.json()
+            return response.json()
 
         except httpx.RequestError as e:
             error_msg = f"Request to Ollama API failed: {str(e)}"
@@ -91,6 +109,24 @@ class OllamaService:
         Returns:
             List of vector embeddings
         """
+        if not texts: return []
+
+        if self.batch_embed_supported:
+            # one request for the whole batch, the model embeds it in a single pass
+            data = {
+                "model": self.embedding_model,
+                "input": texts,
+            }
+            try:
+                response = await self._make_request("/api/embed", data)
+                if "embeddings" not in response: raise OllamaServiceException("No embeddings found in Ollama API response")
+                return response["embeddings"]
+
+            except OllamaServiceException as e:
+                if e.ollama_status_code != 404: raise
+                logger.warning("Ollama has no /api/embed endpoint, falling back to one request per text")
+                self.batch_embed_supported = False
+
         tasks = [self.generate_embedding(text) for text in texts]
         embeddings = await asyncio.gather(*tasks)
         return embeddings
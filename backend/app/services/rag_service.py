@@ -1,6 +1,7 @@
 """
 MeReader RAG (Retrieval-Augmented Generation) Service
 """
+import asyncio
 import logging
 import re
 import time
@@ -82,7 +83,7 @@ class RAGService:
         try:
             start_time = time.time()
             logger.info(f"Processing query for book_id '{book_id}': '{query}'")
-            book = db.query(Book).filter(Book.id == book_id).first()
+            book = db.get(Book, book_id)
 
             if not book: raise BookNotFoundException(book_id)
 
@@ -97,62 +98,37 @@ class RAGService:
 
             # 1: query embeddings and expanded queries
             expanded_queries = await self._expand_query(query, book.title)
-            query_embedding = await embedding_service.embed_single_text(query)
+            query_embedding, *expanded_embeddings = await asyncio.gather(
+                embedding_service.embed_single_text(query),
+                *(embedding_service.embed_single_text(expanded_query) for expanded_query in expanded_queries)
+            )
 
             # 2: retrieve context
             retrieval_start_time = time.time()
             all_results = []
 
-            # bm25
-            try:
-                bm25_results = await bm25_service.search(
-                    query=query,
-                    book_id=book_id,
-                    location_boundary=location_boundary,
-                    limit=settings.BM25_RESULTS_LIMIT
-                )
-                if bm25_results:
-                    logger.info(f"Found {len(bm25_results)} results from BM25 search")
-                    for result in bm25_results: result["search_method"] = "bm25"
-                    all_results.extend(bm25_results)
-            except Exception as e:
-                logger.error(f"BM25 search failed: {str(e)}")
-
+            # vector, summary and expanded vector searches go to qdrant as one batch
+            searches = [
+                {"query_vector": query_embedding, "book_id": book_id, "limit": 15,
+                 "score_threshold": 0.6, "location_boundary": location_boundary},
+                {"query_vector": query_embedding, "book_id": book_id, "limit": 5, "score_threshold": 0.65,
+                 "location_boundary": location_boundary, "filter_metadata": {"content_type": "summary"}},
+                *({"query_vector": expanded_embedding, "book_id": book_id, "limit": 5,
+                   "score_threshold": 0.5, "location_boundary": location_boundary}
+                  for expanded_embedding in expanded_embeddings)
+            ]
+            search_methods = ["vector", "summary", *(["expanded_vector"] * len(expanded_embeddings))]
 
-            # vector
-            search_results = qdrant_manager.search_vectors(
-                query_vector=query_embedding,
-                book_id=book_id,
-                limit=15,
-                score_threshold=0.6,
-                location_boundary=location_boundary
+            # bm25 and the vector batch run concurrently
+            bm25_results, vector_batches = await asyncio.gather(
+                self._bm25_search(query, book_id, location_boundary),
+                qdrant_manager.search_vectors_batch_async(searches)
             )
-            for result in search_results: result["search_method"] = "vector"
-            all_results.extend(search_results)
+            all_results.extend(bm25_results)
 
-            # summary
-            summary_results = qdrant_manager.search_vectors(
-                query_vector=query_embedding,
-                book_id=book_id,
-                limit=5,
-                score_threshold=0.65,
-                location_boundary=location_boundary,
-                filter_metadata={"content_type": "summary"}
-            )
-            for result in summary_results: result["search_method"] = "summary"
-            all_results.extend(summary_results)
-
-            for expanded_query in expanded_queries:
-                expanded_embedding = await embedding_service.embed_single_text(expanded_query)
-                expanded_results = qdrant_manager.search_vectors(
-                    query_vector=expanded_embedding,
-                    book_id=book_id,
-                    limit=5,
-                    score_threshold=0.5,
-                    location_boundary=location_boundary
-                )
-                for result in expanded_results: result["search_method"] = "expanded_vector"
-                all_results.extend(expanded_results)
+            for search_method, search_results in zip(search_methods, vector_batches):
+                for result in search_results: result["search_method"] = search_method
+                all_results.extend(search_results)
 
             retrieval_time = time.time() - retrieval_start_time
             logger.info(f"Combined retrieval finished in {retrieval_time:.2f}s. Total results: {len(all_results)}")
@@ -266,6 +242,31 @@ class RAGService:
             logger.error(f"Failed to process AI query: {str(e)}")
             raise AIQueryException(f"Failed to process AI query: {str(e)}")
 
+    async def _bm25_search(self, query: str, book_id: str, location_boundary: int) -> List[Dict[str, Any]]:
+        """
+        Keyword search for the query, a failure only costs the bm25 results
+        Args:
+            query: User query text
+            book_id: ID of the book
+            location_boundary: Maximum location to include
+        Returns:
+            BM25 results tagged with their search method
+        """
+        try:
+            bm25_results = await bm25_service.search(
+                query=query,
+                book_id=book_id,
+                location_boundary=location_boundary,
+                limit=settings.BM25_RESULTS_LIMIT
+            )
+            if bm25_results:
+                logger.info(f"Found {len(bm25_results)} results from BM25 search")
+                for result in bm25_results: result["search_method"] = "bm25"
+            return bm25_results
+        except Exception as e:
+            logger.error(f"BM25 search failed: {str(e)}")
+            return []
+
     def _prepare_context_from_search_results(self, search_results: List[Dict[str, Any]]) -> str:
         """
         Prepare context string from search results
@@ -5,7 +5,6 @@ import logging
 import re
 import os
 from typing import List, Generator, Tuple
-import gc
 from bs4 import BeautifulSoup, SoupStrainer
 
 logger = logging.getLogger(__name__)
@@ -63,30 +62,7 @@ class TextExtractionUtil:
         """
         try:
             if file_path.endswith('.html'):
-                text = self.extract_text_streamed(file_path)
-                pos = 0
-                buffer = ""
-
-                while pos < len(text):
-                    end_buffer = min(pos + chunk_size * 3, len(text))
-                    buffer = text[pos:end_buffer]
-
-                    chunk_end = min(chunk_size, len(buffer))
-                    paragraph_break = buffer.rfind('\n\n', chunk_size // 2, chunk_size + 50)
-
-                    if paragraph_break != -1 and paragraph_break > chunk_size // 2: chunk_end = paragraph_break + 2
-                    else:
-                        sentence_break = buffer.rfind('. ', chunk_size // 2, chunk_size + 30)
-                        if sentence_break != -1 and sentence_break > chunk_size // 2: chunk_end = sentence_break + 2
-
-                    chunk = buffer[:chunk_end].strip()
-
-                    if chunk and len(chunk) >= min_chunk_size: yield chunk
-
-                    advance = max(chunk_end - (chunk_overlap // 2), chunk_size // 2)
-                    pos += advance
-
-                    if pos % (chunk_size * 20) == 0: gc.collect()
+                yield from self._chunk_text(self.extract_text_streamed(file_path), chunk_size, chunk_overlap, min_chunk_size)
 
             else:
                 # plain text files
@@ -116,6 +92,36 @@ class TextExtractionUtil:
             logger.error(f"Error in chunk_text_streamed: {str(e)}")
             if 'buffer' in locals() and buffer and len(buffer) >= min_chunk_size: yield buffer.strip()
 
+    def chunk_html_content(self, html_content: str, chunk_size: int = 650, chunk_overlap: int = 50, min_chunk_size: int = 100) -> Generator[str, None, None]:
+        """
+        Chunk generation from html already in memory, such as a chapter read from a book's content pack
+        """
+        try: yield from self._chunk_text(self.extract_text_streamed(html_content, False), chunk_size, chunk_overlap, min_chunk_size)
+        except Exception as e: logger.error(f"Error in chunk_html_content: {str(e)}")
+
+    @staticmethod
+    def _chunk_text(text: str, chunk_size: int, chunk_overlap: int, min_chunk_size: int) -> Generator[str, None, None]:
+        """Split extracted text into overlapping chunks, breaking at paragraphs or sentences where possible"""
+        pos = 0
+        while pos < len(text):
+            end_buffer = min(pos + chunk_size * 3, len(text))
+            buffer = text[pos:end_buffer]
+
+            chunk_end = min(chunk_size, len(buffer))
+            paragraph_break = buffer.rfind('\n\n', chunk_size // 2, chunk_size + 50)
+
+            if paragraph_break != -1 and paragraph_break > chunk_size // 2: chunk_end = paragraph_break + 2
+            else:
+                sentence_break = buffer.rfind('. ', chunk_size // 2, chunk_size + 30)
+                if sentence_break != -1 and sentence_break > chunk_size // 2: chunk_end = sentence_break + 2
+
+            chunk = buffer[:chunk_end].strip()
+
+            if chunk and len(chunk) >= min_chunk_size: yield chunk
+
+            advance = max(chunk_end - (chunk_overlap // 2), chunk_size // 2)
+            pos += advance
+
     def batch_chunks(self, generator, batch_size: int = 10) -> Generator[List[str], None, None]:
         """
         Batching of chunks from a generator
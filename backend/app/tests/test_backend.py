@@ -2,6 +2,7 @@
 MeReader Application Tests
 Testing core functionality of the MeReader application
 """
+import asyncio
 import os
 import uuid
 import unittest
@@ -12,23 +13,83 @@ from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
 import gc
+import json
+import numpy as np
+import zipfile
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.db.models import Base
 from app.api.main import app
-from app.db.sqlite import get_db
+from app.db.sqlite import get_db, get_ro_db
 from app.db.models import Book, Chapter, ReadingProgress
 from app.services.book_service import book_service
+from app.services.epub_archive import EpubArchive
+from app.services.bm25_index import BM25Index, build_index, tokenize
 from app.services.location_service import location_service
-from app.services.embedding_service import embedding_service
+from app.services.embedding_service import embedding_service, _summary_point_id
+from app.core.exceptions import VectorStoreException
 from app.services.content_service import content_service
 from app.services.rag_service import rag_service
 from app.services.ollama_service import ollama_service
 from app.services.text_extraction_utility import text_extraction_util
 from app.db.qdrant import qdrant_manager
+from app.core.cache import library_cache
 import app.core.config as config
 
+CONTAINER_XML = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="%s" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+OPF_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="%(version)s">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>Fixture Book</dc:title>
+    <dc:creator>Fixture Author</dc:creator>
+  </metadata>
+  <manifest>%(manifest)s</manifest>
+  <spine%(spine_attrs)s>%(spine)s</spine>
+</package>"""
+
+def chapter_xhtml(title: str, body: str) -> str:
+    """Minimal XHTML chapter document"""
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+        f'<head><title>{title}</title></head><body>{body}</body></html>'
+    )
+
+def write_epub(path: str, opf_path: str, files: dict, manifest: list, spine: list,
+               version: str = "3.0", spine_attrs: str = "") -> str:
+    """
+    Write a fixture EPUB
+    Args:
+        path: Path of the EPUB to write
+        opf_path: Path of the package document within the zip
+        files: Zip entries other than the container and the package document, name to content
+        manifest: (id, href, media type, properties) of each manifest item, hrefs relative to the package document
+        spine: Item ids in reading order
+        version: Package version
+        spine_attrs: Extra attributes of the spine element
+    Returns:
+        The EPUB path
+    """
+    manifest_xml = ''.join(
+        f'<item id="{item_id}" href="{href}" media-type="{media_type}"' + (f' properties="{properties}"' if properties else '') + '/>'
+        for item_id, href, media_type, properties in manifest
+    )
+    spine_xml = ''.join(f'<itemref idref="{item_id}"/>' for item_id in spine)
+
+    with zipfile.ZipFile(path, "w") as epub:
+        epub.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        epub.writestr("META-INF/container.xml", CONTAINER_XML % opf_path)
+        epub.writestr(opf_path, OPF_TEMPLATE % {
+            'version': version, 'manifest': manifest_xml, 'spine': spine_xml, 'spine_attrs': spine_attrs
+        })
+        for name, content in files.items(): epub.writestr(name, content)
+
+    return path
+
 def setup_test_db():
     """Create a test database"""
     test_dir = tempfile.mkdtemp()
@@ -47,6 +108,7 @@ def setup_test_db():
         finally: db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_ro_db] = override_get_db
 
     return {
         'test_dir': test_dir,
@@ -134,13 +196,36 @@ class TestMeReader(unittest.TestCase):
         config.settings = test_settings
 
     def setUp(self):
-        """Set up db before each test"""
+        """Set up db and data directories before each test"""
         self.db = next(app.dependency_overrides[get_db]())
 
+        # services read their data directories from the real settings at import, every file a test writes
+        # goes to a directory removed after the test instead
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        data_paths = {
+            "UPLOAD_DIR": os.path.join(data_dir.name, "uploads"),
+            "CONTENT_DIR": os.path.join(data_dir.name, "contents"),
+            "COVER_DIR": os.path.join(data_dir.name, "covers"),
+            "BM25_INDEX_CACHE_DIR": os.path.join(data_dir.name, "bm25_cache"),
+        }
+        for path in data_paths.values(): os.makedirs(path)
+        patchers = [patch.object(self.original_settings, name, path) for name, path in data_paths.items()]
+        patchers += [
+            patch.object(book_service, 'upload_dir', data_paths["UPLOAD_DIR"]),
+            patch.object(book_service, 'content_dir', data_paths["CONTENT_DIR"]),
+            patch.object(book_service, 'cover_dir', data_paths["COVER_DIR"]),
+            patch.object(content_service, 'content_dir', data_paths["CONTENT_DIR"]),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
         self.db.query(ReadingProgress).delete()
         self.db.query(Chapter).delete()
         self.db.query(Book).delete()
         self.db.commit()
+        library_cache.clear()
 
     def tearDown(self):
         """Clean up after each test"""
@@ -232,6 +317,32 @@ class TestMeReader(unittest.TestCase):
             self.assertEqual(progress.current_location, 1)
             self.assertEqual(progress.completion_percentage, 0.0)
 
+    def test_api_delete_book(self):
+        """Deleting a book removes its row, its files and its vectors"""
+        book_id = str(uuid.uuid4())
+        content_dir = os.path.join(book_service.content_dir, book_id)
+        os.makedirs(content_dir)
+        with open(os.path.join(content_dir, "content.bin"), "wb") as f: f.write(b"<p>The ship left at dawn.</p>")
+        epub_path = os.path.join(book_service.upload_dir, f"{book_id}.epub")
+        with open(epub_path, "wb") as f: f.write(b"PK")
+
+        self.db.add(Book(id=book_id, title="Test Book", author="Test Author", file_path=epub_path, content_path=content_dir))
+        self.db.commit()
+
+        with patch.object(qdrant_manager, 'delete_book_vectors', return_value=True) as delete_vectors, \
+                patch('app.services.embedding_service._set_has_vectors') as set_flag:
+            response = self.client.delete(f"/api/books/{book_id}")
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(self.client.delete(f"/api/books/{book_id}").status_code, 404)
+
+        delete_vectors.assert_called_once_with(book_id)
+        # the row is deleted, its vector flag is not written
+        set_flag.assert_not_called()
+        self.assertFalse(os.path.exists(content_dir))
+        self.assertFalse(os.path.exists(epub_path))
+        self.db.expire_all()
+        self.assertIsNone(self.db.get(Book, book_id))
+
     def test_location_service(self):
         """Test location service functionality"""
         # calculate_locations
@@ -251,22 +362,120 @@ class TestMeReader(unittest.TestCase):
         boundary = location_service.calculate_location_boundary(5, 10)
         self.assertEqual(boundary, 5)
 
-    @patch('app.services.content_service.BeautifulSoup')
-    def test_content_service(self, mock_bs):
+    def test_content_service(self):
         """Test content service functionality"""
-        mock_soup = MagicMock()
-        mock_bs.return_value = mock_soup
+        html_content = (
+            "<!DOCTYPE html><html><head><title>Test</title><script>var a;</script></head>"
+            "<body><p style='color: red'>Test content</p><p> </p><img src='images/pic.png'/></body></html>"
+        )
 
-        mock_soup.find_all.return_value = []
-        mock_soup.get_text.return_value = "Test content"
-        mock_soup.body = MagicMock()
-        mock_soup.body.contents = ["Test content"]
+        processed_html = content_service.process_html_content(html_content)
+        self.assertIn("<p>Test content</p>", processed_html)
+        self.assertNotIn("<script", processed_html)
+        self.assertNotIn("<p> </p>", processed_html)
+        self.assertIn('src="pic.png"', processed_html)
+        self.assertIn('data-epub-src="images/pic.png"', processed_html)
+
+    def test_spine_chapter_title_from_title_element(self):
+        """Spine documents without a heading take their title element"""
+        epub_path = write_epub(
+            os.path.join(self.test_dir, "spine_titles.epub"), "content.opf",
+            files={"part.xhtml": chapter_xhtml("The Crossing", "<p>Chapter 3: Somewhere else. It rained.</p>")},
+            manifest=[("part", "part.xhtml", "application/xhtml+xml", "")],
+            spine=["part"]
+        )
 
-        html_content = "<html><head><title>Test</title></head><body><p>Test content</p></body></html>"
+        with EpubArchive(epub_path) as book:
+            chapters = list(book_service._iter_content(book, "Fixture Book"))
 
-        with patch('app.services.content_service.BeautifulSoup', return_value=mock_soup):
-            processed_html = content_service.process_html_content(html_content)
-            self.assertIn("Test content", processed_html)
+        self.assertEqual(len(chapters), 1)
+        self.assertEqual(chapters[0][0]['title'], "The Crossing")
+        self.assertIn("It rained.", chapters[0][1])
+
+    def test_epub_archive_fixtures(self):
+        """Navigation documents, NCX files and package documents in a subdirectory resolve to manifest items"""
+        ncx = (
+            '<?xml version="1.0" encoding="utf-8"?><ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            '<navMap><navPoint id="p1"><navLabel><text>Harbour</text></navLabel><content src="chapter%201.xhtml"/></navPoint>'
+            '<navPoint id="p2"><navLabel><text>Storm</text></navLabel><content src="chapter%202.xhtml"/></navPoint></navMap></ncx>'
+        )
+        nav = (
+            '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            '<head><title>Contents</title></head><body><nav epub:type="toc"><ol>'
+            '<li><a href="chapter%201.xhtml">Harbour</a></li><li><a href="chapter%202.xhtml">Storm</a></li>'
+            '</ol></nav></body></html>'
+        )
+        chapters = [("Harbour", "<p>The ship left at dawn.</p>"), ("Storm", "<p>The ship turned back.</p>")]
+
+        # (package document, version, spine attributes, toc manifest items, toc files, chapter directory),
+        # paths other than the package document's relative to it
+        fixtures = {
+            # epub 3, the navigation document sits in a subdirectory next to the chapters
+            "nav.epub": ("content.opf", "3.0", "", [("nav", "text/nav.xhtml", "application/xhtml+xml", "nav")],
+                         {"text/nav.xhtml": nav}, "text/"),
+            # epub 2 with only an ncx
+            "ncx.epub": ("content.opf", "2.0", ' toc="ncx"', [("ncx", "toc.ncx", "application/x-dtbncx+xml", "")],
+                         {"toc.ncx": ncx}, ""),
+            # package document and every other entry under OEBPS
+            "oebps.epub": ("OEBPS/content.opf", "2.0", ' toc="ncx"', [("ncx", "toc.ncx", "application/x-dtbncx+xml", "")],
+                           {"toc.ncx": ncx}, ""),
+        }
+        for file_name, (opf_path, version, spine_attrs, toc_items, toc_files, chapter_dir) in fixtures.items():
+            opf_dir = os.path.dirname(opf_path)
+            files = {os.path.join(opf_dir, name): content for name, content in toc_files.items()}
+            manifest = list(toc_items)
+            for i, (title, body) in enumerate(chapters, start=1):
+                files[os.path.join(opf_dir, f"{chapter_dir}chapter {i}.xhtml")] = chapter_xhtml(f"Part {i}", body)
+                manifest.append((f"c{i}", f"{chapter_dir}chapter%20{i}.xhtml", "application/xhtml+xml", ""))
+
+            epub_path = write_epub(
+                os.path.join(self.test_dir, file_name), opf_path, files=files, manifest=manifest,
+                spine=["c1", "c2"], version=version, spine_attrs=spine_attrs
+            )
+
+            with EpubArchive(epub_path) as book:
+                self.assertEqual(
+                    [link.href for link in book.toc], [f"{chapter_dir}chapter 1.xhtml", f"{chapter_dir}chapter 2.xhtml"],
+                    file_name
+                )
+                self.assertEqual(book.get_item_with_href(book.toc[0].href).id, "c1", file_name)
+                processed = list(book_service._iter_content(book, "Fixture Book"))
+
+            self.assertEqual([chapter['title'] for chapter, _ in processed], ["Harbour", "Storm"], file_name)
+            self.assertIn("turned back", processed[1][1], file_name)
+
+    def test_bm25_index_matches_rank_bm25(self):
+        """BM25 index scores match rank_bm25's BM25Okapi and a rebuild replaces the index"""
+        from rank_bm25 import BM25Okapi
+
+        chunks = [
+            "The ship left the harbour at dawn.",
+            "A storm rose and the ship turned back to the harbour.",
+            "Nobody on the island had seen a ship in years.",
+            "The lighthouse keeper wrote about the storm.",
+            "Dawn, dawn, and still no ship.",
+        ]
+        metadata = [{"location": i, "chapter_id": "c1"} for i in range(len(chunks))]
+        index_dir = os.path.join(self.test_dir, "bm25")
+        build_index(index_dir, chunks, metadata)
+
+        index = BM25Index(index_dir)
+        reference = BM25Okapi([tokenize(chunk) for chunk in chunks])
+        for query in (["ship", "harbour"], ["storm", "storm"], ["dawn", "island", "unknown"]):
+            self.assertTrue(np.allclose(index.get_scores(query), reference.get_scores(query)))
+        self.assertEqual(index.chunk(1)["metadata"], {"location": 1, "chapter_id": "c1"})
+
+        # rebuilding swaps the new index in and leaves nothing behind next to it
+        build_index(index_dir, chunks[:2], metadata[:2])
+        self.assertEqual(len(BM25Index(index_dir)), 2)
+        self.assertEqual(os.listdir(self.test_dir).count("bm25"), 1)
+        self.assertFalse([name for name in os.listdir(self.test_dir) if name.startswith(".bm25")])
+
+        # an empty book still writes a loadable index
+        build_index(index_dir, [], [])
+        empty = BM25Index(index_dir)
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(empty.get_scores(["ship"]).size, 0)
 
     @patch('app.services.text_extraction_utility.BeautifulSoup')
     def test_text_extraction(self, mock_bs):
@@ -290,6 +499,87 @@ class TestMeReader(unittest.TestCase):
             embedding = await embedding_service.embed_single_text("Test content")
             self.assertEqual(len(embedding), 768)
 
+    def test_embedding_resume(self):
+        """An ingest that fails part way is resumed without embedding stored chunks or summaries again"""
+        book_id = str(uuid.uuid4())
+        book_dir = os.path.join(self.test_content_dir, book_id)
+        os.makedirs(book_dir, exist_ok=True)
+        self.db.add(Book(id=book_id, title="Test Book", author="Test Author", file_path=self.mock_epub_path,
+                         content_path=book_dir, total_locations=120))
+        for order in range(1, 4):
+            chapter_path = os.path.join(book_dir, f"chapter_{order}.html")
+            with open(chapter_path, "w") as f:
+                f.write("<html><body>" + "".join(
+                    f"<p>Chapter {order} paragraph {i}. " + "The river ran on past the town. " * 8 + "</p>" for i in range(12)
+                ) + "</body></html>")
+            self.db.add(Chapter(id=str(uuid.uuid4()), book_id=book_id, title=f"Chapter {order}", order=order,
+                                content_path=chapter_path, start_location=(order - 1) * 40 + 1, end_location=order * 40))
+        self.db.commit()
+
+        stored = {}
+        embedded_texts = []
+        summaries = []
+        flags = []
+        upserts_before_failure = [1]
+        embedding_failures = [0]
+
+        def add_text_vectors(vectors, metadata, ids):
+            # the second upsert of the first run fails, leaving the first chapter stored
+            if upserts_before_failure[0] == 0: raise VectorStoreException("Qdrant went away")
+            upserts_before_failure[0] -= 1
+            stored.update((point_id, meta) for point_id, meta in zip(ids, metadata))
+
+        async def generate_embeddings_batch(texts):
+            if embedding_failures[0]:
+                embedding_failures[0] -= 1
+                raise RuntimeError("Ollama timed out")
+            embedded_texts.extend(texts)
+            return [[0.0]] * len(texts)
+
+        async def create_location_summary(book_id, location, *args):
+            summaries.append(location)
+            stored[_summary_point_id(book_id, location)] = {'content_type': 'summary'}
+
+        with patch('app.services.embedding_service.UPSERT_BATCH_SIZE', 1), \
+                patch('app.services.embedding_service._set_has_vectors', side_effect=lambda *args: flags.append(args)), \
+                patch.object(qdrant_manager, 'add_text_vectors', side_effect=add_text_vectors), \
+                patch.object(qdrant_manager, 'get_book_point_ids', side_effect=lambda book_id: set(stored)), \
+                patch.object(ollama_service, 'generate_embeddings_batch', side_effect=generate_embeddings_batch), \
+                patch.object(embedding_service, '_create_location_summary', side_effect=create_location_summary), \
+                patch.object(embedding_service, '_create_bm25_index', return_value=None):
+            with self.assertRaises(VectorStoreException):
+                asyncio.run(embedding_service.embed_book_content(book_id, db_session=self.db))
+            self.assertEqual(flags, [])
+
+            first_run_points = dict(stored)
+            first_run_summaries = list(summaries)
+            first_run_chunks = sum(1 for meta in first_run_points.values() if meta.get('content_type') == 'content')
+            self.assertGreater(first_run_chunks, 0)
+            self.assertTrue(first_run_summaries)
+
+            # a batch that fails to embed is skipped, the run finishes but the book is not marked embedded
+            embedded_texts.clear()
+            summaries.clear()
+            upserts_before_failure[0] = 1000
+            embedding_failures[0] = 1
+            second_run_total = asyncio.run(embedding_service.embed_book_content(book_id, db_session=self.db))
+            self.assertEqual(flags, [(book_id, False)])
+            second_run_summaries = list(summaries)
+
+            embedded_texts.clear()
+            summaries.clear()
+            third_run_total = asyncio.run(embedding_service.embed_book_content(book_id, db_session=self.db))
+
+        chunk_texts = [meta['text'] for meta in stored.values() if meta.get('content_type') == 'content']
+        self.assertGreater(third_run_total, 0)
+        self.assertEqual(second_run_total + third_run_total, len(chunk_texts) - first_run_chunks)
+        self.assertEqual(len(embedded_texts), third_run_total)
+        # stored points were kept and neither their chunks nor their summaries were generated again
+        self.assertTrue(set(first_run_points) <= set(stored))
+        self.assertFalse(set(second_run_summaries) & set(first_run_summaries))
+        self.assertFalse(summaries)
+        self.assertEqual(flags, [(book_id, False), (book_id, True)])
+
     @pytest.mark.asyncio
     async def test_rag_service(self):
         """Test RAG service functionality"""
@@ -328,7 +618,7 @@ class TestMeReader(unittest.TestCase):
             self.db.commit()
 
             with patch.object(embedding_service, 'embed_single_text', return_value=[0.1] * 768):
-                with patch.object(qdrant_manager, 'search_vectors', return_value=[
+                with patch.object(qdrant_manager, 'search_vectors_batch', side_effect=lambda searches: [[
                     {
                         "id": "1",
                         "score": 0.9,
@@ -338,7 +628,7 @@ class TestMeReader(unittest.TestCase):
                         "location": 20,
                         "search_method": "vector"
                     }
-                ]):
+                ] for _ in searches]):
                     with patch.object(ollama_service, 'generate_completion',
                                     return_value="This is a test response from the AI."):
 
@@ -354,13 +644,8 @@ class TestMeReader(unittest.TestCase):
                         self.assertEqual(result["book_title"], "Test Book")
                         self.assertEqual(len(result["context_used"]), 1)
 
-    @patch('app.api.routes.progress.datetime')
-    async def test_api_progress(self, mock_datetime):
+    def test_api_progress(self):
         """Test reading progress API"""
-        mock_now = datetime.now(timezone.utc)
-        mock_datetime.now.return_value = mock_now
-        mock_datetime.utcnow.return_value = mock_now.replace(tzinfo=None)
-
         book = Book(
             id=str(uuid.uuid4()),
             title="Test Book",
@@ -395,6 +680,118 @@ class TestMeReader(unittest.TestCase):
         self.assertEqual(progress.current_location, 50)
         self.assertEqual(progress.completion_percentage, 50.0)
 
+        # a second update changes the stored row instead of adding one
+        response = self.client.put(f"/api/progress/{book.id}", json={"current_location": 75.6})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["current_location"], 75)
+
+        self.db.expire_all()
+        progress_rows = self.db.query(ReadingProgress).filter_by(book_id=book.id).all()
+        self.assertEqual(len(progress_rows), 1)
+        self.assertEqual(progress_rows[0].current_location, 75)
+
+    def test_api_chapter_conditional_get(self):
+        """Chapter routes send an ETag and answer a matching If-None-Match with an empty 304"""
+        book_id = str(uuid.uuid4())
+        chapter_path = os.path.join(self.test_content_dir, f"{book_id}_ch1.html")
+        with open(chapter_path, "w", encoding="utf-8") as f: f.write("<p>The ship left at dawn.</p>")
+
+        self.db.add(Book(
+            id=book_id, title="Test Book", author="Test Author", file_path=self.mock_epub_path,
+            content_path=self.test_content_dir, total_locations=10
+        ))
+        self.db.add(Chapter(
+            id="ch1", book_id=book_id, title="Harbour", order=1, content_path=chapter_path,
+            start_location=1, end_location=10
+        ))
+        self.db.commit()
+
+        for url in (f"/api/content/chapter/{book_id}/ch1", f"/api/content/chapter-html/{book_id}/ch1"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn("The ship left at dawn.", response.text, url)
+            etag = response.headers["etag"]
+            self.assertIn("immutable", response.headers["cache-control"], url)
+
+            response = self.client.get(url, headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b"", url)
+            self.assertEqual(response.headers["etag"], etag, url)
+
+            # a stale validator gets the full body again
+            response = self.client.get(url, headers={"If-None-Match": '"stale"'})
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_parse_book_packs_chapters(self):
+        """Parsed chapters are only written to the content pack and every chapter route reads them from it"""
+        epub_path = write_epub(
+            os.path.join(self.test_dir, "packed.epub"), "content.opf",
+            files={
+                "c1.xhtml": chapter_xhtml("Harbour", "<h1>Harbour</h1><p>The ship left at dawn.</p>"),
+                "c2.xhtml": chapter_xhtml("Storm", "<h1>Storm</h1><p>The ship turned back.</p>"),
+            },
+            manifest=[("c1", "c1.xhtml", "application/xhtml+xml", ""), ("c2", "c2.xhtml", "application/xhtml+xml", "")],
+            spine=["c1", "c2"]
+        )
+        book_data = book_service.parse_book(epub_path)
+
+        content_dir = book_data['content_dir']
+        self.assertIn("content.bin", os.listdir(content_dir))
+        self.assertFalse([name for name in os.listdir(content_dir) if name.startswith("chapter_")])
+
+        book_id = book_data['id']
+        self.db.add(Book(
+            id=book_id, title="Fixture Book", author="Fixture Author", file_path=epub_path,
+            content_path=content_dir, total_locations=book_data['total_locations']
+        ))
+        for chapter in book_data['chapters']:
+            self.db.add(Chapter(
+                id=f"{book_id}-{chapter['order']}", book_id=book_id, title=chapter['title'], order=chapter['order'],
+                content_path=chapter['content_path'], content_offset=chapter['content_offset'],
+                content_size=chapter['content_size'], start_location=chapter['start_location'],
+                end_location=chapter['end_location']
+            ))
+        self.db.commit()
+
+        second = book_data['chapters'][1]
+        chapter_id = f"{book_id}-{second['order']}"
+        response = self.client.get(f"/api/content/chapter/{book_id}/{chapter_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("turned back", response.json()["content"])
+        self.assertNotIn("left at dawn", response.json()["content"])
+
+        response = self.client.get(f"/api/content/chapter-html/{book_id}/{chapter_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("turned back", response.text)
+        response = self.client.get(
+            f"/api/content/chapter-html/{book_id}/{chapter_id}", headers={"If-None-Match": response.headers["etag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(f"/api/content/text-at-location/{book_id}/{second['start_location']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("turned back", response.json()["text"])
+
+        lines = self.client.get(f"/api/content/book-content/{book_id}").text.splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("left at dawn", lines[1])
+        self.assertIn("turned back", lines[2])
+        self.assertEqual(json.loads(lines[3]), {"done": True, "chapters_sent": 2})
+
+        # a failure part way ends the stream with an error line instead of just stopping
+        with patch('app.api.routes.content._read_chapter_file', side_effect=["<p>first</p>", RuntimeError("disk gone")]):
+            lines = self.client.get(f"/api/content/book-content/{book_id}").text.splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[2])["chapters_sent"], 1)
+        self.assertIn("disk gone", json.loads(lines[2])["error"])
+
+    def test_api_progress_rejects_invalid_location(self):
+        """Infinite, NaN or non numeric locations are rejected as invalid input"""
+        book_id = str(uuid.uuid4())
+        for location in ("inf", "-inf", "nan", "ten", [1], {"at": 1}):
+            response = self.client.put(f"/api/progress/{book_id}", json={"current_location": location})
+            self.assertEqual(response.status_code, 422, location)
+
     @pytest.mark.asyncio
     def test_api_query(self):
         """Test AI query API"""